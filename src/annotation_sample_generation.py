@@ -2,41 +2,130 @@ import json
 import argparse
 import random
 import os
-
-
-def load_json_file(filepath):
-    """Load a JSON file containing a list of objects."""
-    with open(filepath, "r", encoding="utf-8") as file:
-        return json.load(file)
-
-
-def sample_subsets(data, m, n):
-    """Generate m subsets of size n from the data without replacement."""
-    if len(data) < m * n:
+from collections import defaultdict
+
+from record_io import iter_records
+from text_normalization import normalize_sentence
+
+
+def iter_items(filepaths):
+    """Stream the objects of several JSON/JSONL files one after another."""
+    for filepath in filepaths:
+        yield from iter_records(filepath)
+
+
+def allocate(sizes, total):
+    """Split `total` across groups proportionally to `sizes` (largest remainder)."""
+    population = sum(sizes.values())
+    shares = {key: total * size / population for key, size in sizes.items()}
+    counts = {key: int(share) for key, share in shares.items()}
+    remainders = sorted(shares, key=lambda key: shares[key] - counts[key], reverse=True)
+    for key in remainders[: total - sum(counts.values())]:
+        counts[key] += 1
+    return counts
+
+
+def unique_items(filepaths, stratify=None):
+    """Index of the first item of every distinct sentence, and its stratum.
+
+    Sentences are compared after `normalize_sentence`, so the same verse
+    from both files, or with different punctuation, is only one candidate
+    and cannot end up in two subsets.
+    """
+    seen = set()
+    indices, strata = list(), list()
+    for idx, item in enumerate(iter_items(filepaths)):
+        key = normalize_sentence(item.get("sentence", ""))
+        if key in seen:
+            continue
+        seen.add(key)
+        indices.append(idx)
+        strata.append(item.get(stratify) if stratify else None)
+    return indices, strata
+
+
+def sample_subsets(indices, m, n, seed=None, strata=None):
+    """Pick m disjoint subsets of size n from the item `indices`.
+
+    Sampling works on indices only, so it is linear in the number of items.
+    With `strata` (one key per index), every stratum contributes to each
+    subset in proportion to its size.
+    """
+    if len(indices) < m * n:
         raise ValueError(
             "Not enough data to create m subsets of size n without replacement."
         )
 
-    sampled_subsets = []
-    for _ in range(m):
-        subset = random.sample(data, n)
-        sampled_subsets.append(subset)
-        data = [item for item in data if item not in subset]
-
-    return sampled_subsets
+    rng = random.Random(seed)
+    if strata is None:
+        chosen = rng.sample(indices, m * n)
+    else:
+        groups = defaultdict(list)
+        for idx, stratum in zip(indices, strata):
+            groups[stratum].append(idx)
+        counts = allocate({key: len(group) for key, group in groups.items()}, m * n)
+        chosen = list()
+        for key, group in groups.items():
+            chosen.extend(rng.sample(group, counts[key]))
+
+    # Deal the chosen indices round-robin so each stratum is spread evenly.
+    return [chosen[i::m] for i in range(m)]
+
+
+def save_subsets_to_files(filepaths, subsets, output_dir):
+    """Stream the sampled items into one JSON file per subset.
+
+    The input is read a second time and each selected item is written as soon
+    as it is reached, so only the index assignment is held in memory. Items
+    appear in input order within each subset file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
 
+    assignment = {idx: i for i, subset in enumerate(subsets) for idx in subset}
+    files = [
+        open(os.path.join(output_dir, f"subset_{i + 1}.json"), "w", encoding="utf-8")
+        for i in range(len(subsets))
+    ]
+    written = [0] * len(subsets)
+    try:
+        for file in files:
+            file.write("[")
+        for idx, item in enumerate(iter_items(filepaths)):
+            if idx not in assignment:
+                continue
+            i = assignment[idx]
+            body = json.dumps(item, indent=4, ensure_ascii=False)
+            files[i].write("," if written[i] else "")
+            files[i].write("\n" + "\n".join("    " + line for line in body.split("\n")))
+            written[i] += 1
+        for file in files:
+            file.write("\n]")
+    finally:
+        for file in files:
+            file.close()
+
+
+def main(args):
+    filepaths = [path for path in (args.file1, args.file2) if path]
+
+    # First pass: find the distinct sentences and their stratification keys
+    indices, strata = unique_items(filepaths, args.stratify)
+    if not args.stratify:
+        strata = None
 
-def save_subsets_to_files(subsets, output_dir):
-    """Save each subset to a separate JSON file."""
-    os.makedirs(output_dir, exist_ok=True)
+    # Sample subsets
+    try:
+        subsets = sample_subsets(indices, args.m, args.n, args.seed, strata)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
 
-    for i, subset in enumerate(subsets):
-        output_path = os.path.join(output_dir, f"subset_{i + 1}.json")
-        with open(output_path, "w", encoding="utf-8") as file:
-            json.dump(subset, file, indent=4, ensure_ascii=False)
+    # Second pass: save the subsets to files
+    save_subsets_to_files(filepaths, subsets, args.output_dir)
+    print(f"Successfully saved {args.m} subsets of size {args.n} to {args.output_dir}.")
 
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Sample subsets from combined JSON files."
     )
@@ -47,27 +136,18 @@ def main():
     parser.add_argument(
         "-output_dir", type=str, help="Directory to save the output JSON files."
     )
-
-    args = parser.parse_args()
-
-    # Load data from the JSON files
-    data1 = load_json_file(args.file1)
-    data2 = load_json_file(args.file2)
-
-    # Combine the data from both files
-    combined_data = data1 + data2
-
-    # Sample subsets
-    try:
-        subsets = sample_subsets(combined_data, args.m, args.n)
-    except ValueError as e:
-        print(f"Error: {e}")
-        return
-
-    # Save the subsets to files
-    save_subsets_to_files(subsets, args.output_dir)
-    print(f"Successfully saved {args.m} subsets of size {args.n} to {args.output_dir}.")
+    parser.add_argument(
+        "-seed", type=int, default=None, help="Random seed for reproducible subsets."
+    )
+    parser.add_argument(
+        "-stratify",
+        type=str,
+        default=None,
+        choices=["label", "human_label", "system_label"],
+        help="Keep the distribution of this field in every subset.",
+    )
+    return parser
 
 
 if __name__ == "__main__":
-    main()
+    main(build_parser().parse_args())
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_server import MockServer
+from record_io import iter_records
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS = {
+    "classification": "upma_classification.py",
+    "purnopama": "purnopama_component_identification.py",
+    "construe": "construe_component_identification.py",
+}
+
+
+def write_component_input(paths, output_path):
+    """Turn annotated classification data into input for the component scripts.
+
+    The component scripts read the `label` written by `upma_classification.py`;
+    the annotated files store it as `system_label`.
+    """
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as fp:
+        for path in paths:
+            for item in iter_records(path):
+                item.setdefault("label", item.get("system_label"))
+                fp.write(json.dumps(item, ensure_ascii=False) + "\n")
+                count += item["label"] == "pūrṇopamā"
+    return count
+
+
+def run_script(script, input_path, concurrency, base_url, workdir, extra_args):
+    output_path = os.path.join(workdir, f"{script}-{concurrency}.jsonl")
+    command = [
+        sys.executable,
+        os.path.join(SRC_DIR, SCRIPTS[script]),
+        "-i",
+        input_path,
+        "-o",
+        output_path,
+        "-b",
+        str(concurrency),
+        "--async-mode",
+        "--no-cache",
+        "--endpoint",
+        base_url,
+        *extra_args,
+    ]
+    started = time.perf_counter()
+    subprocess.run(command, check=True, capture_output=True)
+    wall_time = time.perf_counter() - started
+
+    with open(os.path.join(workdir, f"{script}-{concurrency}.perf.json")) as fp:
+        perf = json.load(fp)
+    sentences = max(1, perf["succeeded"])
+    # Time the client spends beyond what the server needed, had the requests
+    # been perfectly packed into `concurrency` slots.
+    server_time = (perf["latency"]["mean"] or 0) * perf["requests"] / concurrency
+    return {
+        "script": script,
+        "concurrency": concurrency,
+        "sentences": perf["succeeded"],
+        "wall_time": wall_time,
+        "run_time": perf["wall_time"],
+        "startup_time": wall_time - perf["wall_time"],
+        "throughput": perf["succeeded"] / wall_time,
+        "latency_p50": perf["latency"]["p50"],
+        "latency_p99": perf["latency"]["p99"],
+        "overhead_per_sentence_ms": max(0.0, perf["wall_time"] - server_time)
+        / sentences
+        * 1000,
+    }
+
+
+def main(args):
+    server = MockServer(
+        ttft=args.ttft,
+        tokens_per_sec=args.tokens_per_sec,
+        error_rate=args.error_rate,
+        data_dir=args.data_dir,
+    ).start()
+
+    results = list()
+    with tempfile.TemporaryDirectory() as workdir:
+        component_input = os.path.join(workdir, "classified.jsonl")
+        write_component_input(args.component_input, component_input)
+        inputs = {
+            "classification": args.classification_input,
+            "purnopama": component_input,
+            "construe": component_input,
+        }
+        for script in args.scripts:
+            for concurrency in args.concurrency:
+                result = run_script(
+                    script,
+                    inputs[script],
+                    concurrency,
+                    server.base_url,
+                    workdir,
+                    args.script_args,
+                )
+                results.append(result)
+                print(
+                    f"{script:>15} c={concurrency:<4} "
+                    f"{result['throughput']:8.2f} sent/s  "
+                    f"overhead {result['overhead_per_sentence_ms']:7.2f} ms/sent  "
+                    f"startup {result['startup_time']:5.2f} s"
+                )
+    server.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=4)
+
+    if args.max_overhead_ms is not None:
+        worst = max(result["overhead_per_sentence_ms"] for result in results)
+        if worst > args.max_overhead_ms:
+            print(
+                f"Client overhead {worst:.2f} ms/sentence exceeds "
+                f"{args.max_overhead_ms} ms"
+            )
+            sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the inference scripts against a local mock server."
+    )
+    parser.add_argument(
+        "-s",
+        "--scripts",
+        nargs="+",
+        choices=sorted(SCRIPTS),
+        default=["classification", "purnopama", "construe"],
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, nargs="+", default=[1, 4, 16, 64]
+    )
+    parser.add_argument(
+        "--classification-input", type=str, default="data/raw/raghuvansha.tsv"
+    )
+    parser.add_argument(
+        "--component-input",
+        type=str,
+        nargs="+",
+        default=[
+            "data/upma_classification/raghuvansha.json",
+            "data/upma_classification/ramayana.json",
+        ],
+    )
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument(
+        "--ttft",
+        type=str,
+        default="fixed:0.05",
+        help='Time to first token: "fixed:s", "uniform:a:b" or "lognormal:mu:sigma".',
+    )
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--script-args",
+        nargs=argparse.REMAINDER,
+        default=[],
+        help="Extra arguments passed to every script, e.g. --stream.",
+    )
+    parser.add_argument("-o", "--output", type=str, default=None)
+    parser.add_argument(
+        "--max-overhead-ms",
+        type=float,
+        default=None,
+        help="Exit non-zero if any run's client overhead per sentence exceeds this.",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -0,0 +1,67 @@
+import importlib
+import os
+import sys
+
+
+# command: (module, description). A module is imported only when its command
+# runs, so every command starts without loading the others' dependencies.
+COMMANDS = {
+    "classify": ("upma_classification", "Classify sentences by type of Upamā."),
+    "components": (
+        "purnopama_component_identification",
+        "Identify the components of pūrṇopamā sentences.",
+    ),
+    "construe": (
+        "construe_component_identification",
+        "Build the construe and identify the components.",
+    ),
+    "pipeline": (
+        "pipeline",
+        "Classification, component identification and evaluation in one run.",
+    ),
+    "eval-classification": ("upma_classification_eval", "Score classifications."),
+    "eval-components": (
+        "purnopama_component_identification_eval",
+        "Score identified components.",
+    ),
+    "sample": ("annotation_sample_generation", "Sample subsets for annotation."),
+    "few-shot-index": ("few_shot", "Build or query the few-shot example index."),
+    "convert": ("convert_columnar", "Convert record files to Parquet or Arrow."),
+    "mock-server": ("mock_server", "Serve canned chat completions."),
+    "benchmark": ("benchmark", "Benchmark the inference scripts on the mock server."),
+    "startup": ("startup_benchmark", "Measure the import time of every command."),
+}
+
+
+def usage(prog):
+    width = max(len(command) for command in COMMANDS)
+    lines = [f"usage: {prog} <command> [args]", "", "commands:"]
+    lines += [
+        f"  {command:<{width}}  {description}"
+        for command, (_, description) in COMMANDS.items()
+    ]
+    lines += ["", f"Run '{prog} <command> -h' for the arguments of a command."]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    prog = os.path.basename(sys.argv[0])
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage(prog))
+        return 0
+    command, *rest = argv
+    if command not in COMMANDS:
+        print(usage(prog), file=sys.stderr)
+        print(f"\n{prog}: unknown command {command!r}", file=sys.stderr)
+        return 2
+
+    module = importlib.import_module(COMMANDS[command][0])
+    parser = module.build_parser()
+    parser.prog = f"{prog} {command}"
+    module.main(parser.parse_args(rest))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
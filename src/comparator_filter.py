@@ -0,0 +1,165 @@
+import re
+import unicodedata
+from collections import deque
+
+
+# Surface forms of the comparators listed in the classification prompt, with
+# where they may occur in a word:
+#   word   - a whole word (vā, va)
+#   suffix - at the end of a word, possibly joined by sandhi to the word
+#            before (sāgarasya + iva -> sāgarasyeva, dviṣad + vat -> dviṣadvat)
+#   stem   - anywhere; the comparator is declined, compounded or joined by
+#            sandhi on both sides (dīptam + iva + analam -> dīptamivānalam,
+#            śata + upama -> śatopama, pṛthivīsamaḥ)
+#   inner  - inside a word but not at its start, for stems that only
+#            compare as the last member of a compound (marutsakhābham)
+# The forms favour recall: "eva" is also the particle, and "iva" occurs in
+# words like śiva. A sentence without any match almost never has a comparator.
+COMPARATOR_FORMS = {
+    "iva": [
+        ("iva", "stem"),
+        ("ivā", "stem"),
+        ("ive", "stem"),
+        ("ivo", "stem"),
+        ("īva", "suffix"),
+        ("eva", "suffix"),
+    ],
+    "yathā": [("yathā", "stem"), ("yatha", "stem")],
+    "vā": [("vā", "word")],
+    "va": [("va", "word")],
+    "vat": [("vat", "suffix"), ("vad", "suffix")],
+    "sadṛśa": [("sadṛś", "stem"), ("sadṛk", "stem")],
+    "tulya": [("tulya", "stem"), ("tulā", "stem")],
+    "saṅkāśa": [("saṅkāś", "stem"), ("saṃkāś", "stem"), ("sankāś", "stem")],
+    "sannibha": [("sannibh", "stem"), ("saṃnibh", "stem")],
+    "upama": [("upam", "stem"), ("opam", "stem")],
+    "nīkāśa": [("nīkāś", "stem"), ("nikāś", "stem")],
+    "sama": [
+        (form, "stem") for form in ("samaḥ", "samo", "samā", "samam", "samaṃ", "samau")
+    ],
+    "ābha": [("ābh", "inner")],
+    "nibha": [("nibh", "inner")],
+    "pratīkāśa": [("pratīkāś", "stem")],
+    "prakhya": [("prakhy", "inner")],
+    "pratinidhi": [("pratinidh", "stem")],
+    "savarṇa": [("savarṇ", "inner")],
+}
+
+# Label of sentences the pre-filter kept from the model. A missing comparator
+# does not rule out luptopamā, so they are left for review, not labelled none,
+# and the classification eval counts them as abstentions.
+UNRESOLVED = "unresolved"
+
+_WORD_CHAR = re.compile(r"\w")
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; one pass over the text finds every match."""
+
+    def __init__(self, patterns):
+        self.goto = [dict()]
+        self.fail = [0]
+        self.outputs = [list()]
+        for pattern, value in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.outputs.append(list())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.outputs[state].append((len(pattern), value))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] = (
+                    self.outputs[child] + self.outputs[self.fail[child]]
+                )
+
+    def iter(self, text):
+        """Yield (start, end, value) for every pattern occurrence in `text`."""
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.outputs[state]:
+                yield end - length, end, value
+
+
+def _boundary(text, index):
+    return index <= 0 or index >= len(text) or not _WORD_CHAR.match(text[index])
+
+
+def _allowed(text, start, end, position):
+    before, after = _boundary(text, start - 1), _boundary(text, end)
+    if position == "word":
+        return before and after
+    if position == "suffix":
+        return after
+    if position == "inner":
+        return not before
+    return True
+
+
+MATCHER = AhoCorasick(
+    (form, (comparator, position))
+    for comparator, forms in COMPARATOR_FORMS.items()
+    for form, position in forms
+)
+
+
+def find_comparators(sentence):
+    """Candidate comparators in `sentence` as {comparator, form, start, end}.
+
+    Spans index the NFC-normalized, lowercased sentence. Overlapping matches
+    (nibh inside sannibh) keep only the longest.
+    """
+    text = unicodedata.normalize("NFC", sentence).lower()
+    matches = [
+        (start, end, comparator)
+        for start, end, (comparator, position) in MATCHER.iter(text)
+        if _allowed(text, start, end, position)
+    ]
+    matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+    spans = list()
+    for start, end, comparator in matches:
+        if spans and start < spans[-1]["end"]:
+            continue
+        spans.append(
+            {
+                "comparator": comparator,
+                "form": text[start:end],
+                "start": start,
+                "end": end,
+            }
+        )
+    return spans
+
+
+def format_hints(spans):
+    return ", ".join(
+        f"{span['form']} ({span['comparator']}) at {span['start']}-{span['end']}"
+        for span in spans
+    )
+
+
+def add_prefilter_args(parser):
+    parser.add_argument(
+        "--prefilter",
+        choices=["off", "hints", "skip"],
+        default="off",
+        help="Rule-based comparator pre-pass: 'hints' adds the candidate "
+        "comparators to the prompt; 'skip' also keeps sentences without any "
+        "from the model and labels them 'unresolved' for review (a missing "
+        "comparator does not rule out luptopamā); the classification eval "
+        "reports those as abstentions.",
+    )
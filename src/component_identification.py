@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+
+from dedup import Deduplicator, add_dedup_args, count_jobs
+from few_shot import add_few_shot_args, few_shot_from_args
+from guided_decoding import add_guided_args, request_options
+from llm_client import (
+    add_client_args,
+    client_from_args,
+    dispatch_from_args,
+    run_bounded,
+)
+from postprocess import (
+    PostProcessor,
+    add_postprocess_args,
+    finish_components,
+    post_processor_from_args,
+    report_failure,
+)
+from record_io import ModelSinks, add_output_args, iter_records
+from self_consistency import add_sampling_args, choice_contents, sampling_options
+
+
+FEW_SHOT_TEMPLATE = """**Examples:**
+
+{examples}
+"""
+
+
+class ComponentTask:
+    """One component identification prompt, with the runner shared by its scripts.
+
+    The purnopama and construe scripts only differ in what is given here:
+    the prompts, `render_example(number, example)` for few-shot examples,
+    `parse_content(content, repair)` for the completions, the guided
+    decoding `guide` and any extra request `options`. `few_shot_requires`
+    is the field an example needs to be shown with this prompt.
+
+    With --few-shot the fixed examples are dropped from the system prompt,
+    which stays identical across requests, and the selected ones go to the
+    user turn.
+    """
+
+    def __init__(
+        self,
+        system_prompt,
+        user_prompt_template,
+        render_example,
+        parse_content,
+        guide,
+        few_shot_requires=None,
+        options=None,
+    ):
+        self.system_prompt = system_prompt
+        self.few_shot_system_prompt = (
+            system_prompt.split("**Examples:**")[0]
+            + "Give only the output in the specified format and nothing else.\n"
+        )
+        self.user_prompt_template = user_prompt_template
+        self.render_example = render_example
+        self.parse_content = parse_content
+        self.guide = guide
+        self.few_shot_requires = few_shot_requires
+        self.options = options or {}
+
+    def build_messages(self, sentence, examples=None):
+        user_prompt = self.user_prompt_template.format(sentence=sentence)
+        system_prompt = self.system_prompt
+        if examples is not None:
+            system_prompt = self.few_shot_system_prompt
+            rendered = "\n\n".join(
+                self.render_example(number, example)
+                for number, example in enumerate(examples, 1)
+            )
+            user_prompt = FEW_SHOT_TEMPLATE.format(examples=rendered) + user_prompt
+        return [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": user_prompt,
+            },
+        ]
+
+    def request_args(self, item, guided=False, samples=1, few_shot=None):
+        sentence = item["sentence"]
+        examples = few_shot.select(sentence) if few_shot is not None else None
+        return self.build_messages(sentence, examples), {
+            **self.options,
+            **request_options(self.guide, guided),
+            **sampling_options(samples),
+        }
+
+    def request(self, llm, item, model=None, guided=False, samples=1, few_shot=None):
+        messages, options = self.request_args(item, guided, samples, few_shot)
+        return choice_contents(llm.chat(messages, model=model, **options))
+
+    async def request_async(
+        self, llm, item, model=None, guided=False, samples=1, few_shot=None
+    ):
+        messages, options = self.request_args(item, guided, samples, few_shot)
+        return choice_contents(await llm.achat(messages, model=model, **options))
+
+    def identify(
+        self, llm, item, model=None, guided=False, samples=1, few_shot=None, clean=False
+    ):
+        contents = ""
+        try:
+            contents = self.request(llm, item, model, guided, samples, few_shot)
+            return finish_components(
+                item, contents, self.parse_content, model, samples, clean
+            )
+
+        except Exception as e:
+            report_failure(llm, item["sentence"], model, e, contents)
+            return None
+
+    async def finish_async(self, llm, item, model, contents, samples, post):
+        try:
+            return await post.run(
+                finish_components,
+                item,
+                contents,
+                self.parse_content,
+                model,
+                samples,
+                post.clean,
+            )
+        except Exception as e:
+            report_failure(llm, item["sentence"], model, e, contents)
+            return None
+
+    async def identify_async(
+        self, llm, item, model=None, guided=False, samples=1, few_shot=None, post=None
+    ):
+        post = post or PostProcessor()
+        try:
+            contents = await self.request_async(
+                llm, item, model, guided, samples, few_shot
+            )
+        except Exception as e:
+            report_failure(llm, item["sentence"], model, e, "")
+            return None
+        return await self.finish_async(llm, item, model, contents, samples, post)
+
+    async def identify_all_async(
+        self,
+        llm,
+        jobs,
+        max_in_flight,
+        on_result,
+        guided=False,
+        samples=1,
+        few_shot=None,
+        post=None,
+        total=None,
+    ):
+        post = post or PostProcessor()
+
+        async def request(job):
+            model, item = job
+            try:
+                contents = await self.request_async(
+                    llm, item, model, guided, samples, few_shot
+                )
+                return item, model, contents
+            except Exception as e:
+                report_failure(llm, item["sentence"], model, e, "")
+                return None
+
+        async def postprocess(pending):
+            if pending is None:
+                return None
+            item, model, contents = pending
+            return await self.finish_async(llm, item, model, contents, samples, post)
+
+        try:
+            await run_bounded(
+                jobs,
+                request,
+                max_in_flight,
+                on_result,
+                total=total,
+                warmup=llm.prefix_warmup,
+                postprocess=postprocess,
+            )
+        finally:
+            await llm.aclose()
+
+    def main(self, args):
+        llm = client_from_args(args)
+        few_shot = few_shot_from_args(args, self.few_shot_requires)
+        post = post_processor_from_args(args)
+        sink = ModelSinks(args.output_file_path, llm.models, resume=args.resume)
+
+        def read_jobs():
+            records = iter_records(args.input_file_path, label="pūrṇopamā")
+            return sink.jobs(records)
+
+        # A counting pass over the input, so progress shows the job count.
+        total = count_jobs(read_jobs(), args.dedup)
+        jobs, on_result = read_jobs(), sink.add
+        dedup = None
+        if args.dedup:
+            dedup = Deduplicator(sink.add)
+            jobs, on_result = dedup.jobs(jobs), dedup.add
+
+        jobs, max_in_flight, async_mode = dispatch_from_args(args, jobs)
+        try:
+            if async_mode:
+                asyncio.run(
+                    self.identify_all_async(
+                        llm,
+                        jobs,
+                        max_in_flight,
+                        on_result,
+                        args.guided,
+                        args.samples,
+                        few_shot,
+                        post,
+                        total,
+                    )
+                )
+            else:
+                from tqdm import tqdm
+
+                for idx, (model, item) in enumerate(tqdm(jobs, total=total)):
+                    record = self.identify(
+                        llm,
+                        item,
+                        model=model,
+                        guided=args.guided,
+                        samples=args.samples,
+                        few_shot=few_shot,
+                        clean=post.clean,
+                    )
+                    on_result(idx, record)
+        finally:
+            llm.report(args.output_file_path)
+            llm.close()
+            post.close()
+            sink.close()
+
+        print("Number of successful sentences: ", sink.count)
+        if dedup is not None:
+            dedup.report()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input-file-path", type=str, required=True)
+    parser.add_argument("-o", "--output-file-path", type=str, required=True)
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Maximum number of in-flight requests in async mode.",
+    )
+    parser.add_argument(
+        "--async-mode",
+        action="store_true",
+        help="Dispatch requests concurrently with AsyncOpenAI.",
+    )
+    add_output_args(parser)
+    add_dedup_args(parser)
+    add_client_args(parser)
+    add_guided_args(parser)
+    add_sampling_args(parser)
+    add_postprocess_args(parser)
+    add_few_shot_args(parser)
+    return parser
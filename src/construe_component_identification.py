@@ -1,15 +1,6 @@
-import os
-import argparse
-from openai import OpenAI
-from tqdm import tqdm
-import json
-import re
-import pandas as pd
+from component_identification import ComponentTask, build_parser
 
 
-client = OpenAI(base_url="http://localhost:8000/v1", api_key="token-123")
-MODEL_NAME = "/home/himanshu.dutta/hf_models/llama-3.1-8b-instruct/"
-
 SYSTEM_PROMPT = """You are a highly knowledgeable language model specializing in classical Sanskrit poetics.You will be given a prose/poetry excerpt in Sanskrit (Romanized) which has presence of the figure of speech called Upamā alaṅkāra. Your task is to construct the construe and identify the essential elements of Upamā alaṅkāra: Upameya, Upamāna, Sādhāraṇadharma, and Upamādyotaka. Upamā alaṅkāra and its elements are described below.
 
 
@@ -140,51 +131,31 @@ def parse_string_to_dict(inp):
     return parsed_dict
 
 
-def main(args):
-    with open(args.input_file_path, "r", encoding="utf-8") as fp:
-        data = json.load(fp)
-    outputs = list()
-    for item in tqdm(data):
-        label = item["label"]
-        if label != "pūrṇopamā":
-            continue
-        sentence = item["sentence"]
-        response = ""
-        user_prompt = USER_PROMPT_TEMPLATE.format(sentence=sentence)
-        try:
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {
-                        "role": "user",
-                        "content": user_prompt,
-                    },
-                ],
-                max_tokens=1024,
-                temperature=0.5,
-            )
-            response = response.choices[0].message.content.strip().lower()
-            # response = response.replace("\n", " ")
-            response = parse_string_to_dict(response)
-
-            item["components"] = response
-            outputs.append(item)
-
-        except Exception as e:
-            print(f"Exception for sentence: {sentence}")
-            print(f"Response: {response}")
-    print("Number of successful sentences: ", len(outputs))
-    with open(args.output_file_path, "w", encoding="utf-8") as fp:
-        json.dump(outputs, fp, indent=4, ensure_ascii=False)
+def render_example(number, example):
+    lines = [f"Construe: {example['construe']}"] + [
+        f"{key.capitalize()}: {value}" for key, value in example["components"].items()
+    ]
+    return f'Example {number}:\nInput: "{example["sentence"]}"\nOutput:\n' + "\n".join(
+        lines
+    )
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input-file-path", type=str, required=True)
-    parser.add_argument("-o", "--output-file-path", type=str, required=True)
-    parser.add_argument("-b", "--batch-size", type=int, default=8)
+def parse_content(content, repair=False):
+    # "Key: value" lines rather than JSON, so there is nothing to repair.
+    return parse_string_to_dict(content.strip().lower())
+
 
-    args = parser.parse_args()
+TASK = ComponentTask(
+    SYSTEM_PROMPT,
+    USER_PROMPT_TEMPLATE,
+    render_example,
+    parse_content,
+    guide="construe",
+    few_shot_requires="construe",
+    options={"temperature": 0.5},
+)
+main = TASK.main
 
-    main(args)
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
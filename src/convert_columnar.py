@@ -0,0 +1,93 @@
+import argparse
+import glob
+import os
+
+from record_io import iter_records, write_columnar
+
+
+def input_base(pattern):
+    """Directory an input's matches are mirrored relative to.
+
+    That is the parent of the pattern's part before its first wildcard, so
+    `data/`, `../data` and `data/*/*.json` all mirror as `data/...`.
+    """
+    parts = list()
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.path.dirname(os.sep.join(parts)) or "."
+
+
+def expand_inputs(patterns):
+    """(path, base) of the files matching the patterns.
+
+    A directory stands for the JSON files under it; `base` is the directory
+    the path is mirrored relative to under --output-dir.
+    """
+    paths = dict()
+    for pattern in patterns:
+        base = input_base(pattern)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.json")
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            paths.setdefault(path, base)
+    return list(paths.items())
+
+
+def convert(path, fmt, output_dir=None, base="."):
+    root = os.path.splitext(path)[0]
+    if output_dir is not None:
+        root = os.path.join(output_dir, os.path.relpath(root, base))
+        output_dir = os.path.abspath(output_dir)
+        if os.path.commonpath([output_dir, os.path.abspath(root)]) != output_dir:
+            raise ValueError(f"would be written outside {output_dir}")
+        os.makedirs(os.path.dirname(root), exist_ok=True)
+    output_path = f"{root}.{fmt}"
+    write_columnar(iter_records(path), output_path)
+    return output_path
+
+
+def main(args):
+    for path, base in expand_inputs(args.inputs):
+        try:
+            output_path = convert(path, args.format, args.output_dir, base)
+        except ValueError as e:
+            # Metric files under results/ are JSON objects, not record arrays.
+            print(f"Skipping {path}: {e}")
+            continue
+        print(
+            f"{path} ({os.path.getsize(path)} B) -> "
+            f"{output_path} ({os.path.getsize(output_path)} B)"
+        )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Convert JSON/JSONL record files to Parquet or Arrow."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Files, glob patterns or directories, e.g. data/ or 'results/*/*.json'",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["parquet", "arrow"],
+        default="parquet",
+        help="parquet is smallest; arrow is uncompressed and memory-mapped on read.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Mirror the input paths under this directory instead of writing "
+        "next to each input.",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -0,0 +1,95 @@
+from text_normalization import canonical_sentence, verse_key
+
+
+def canonical_item(item):
+    if isinstance(item, dict):
+        return {**item, "sentence": canonical_sentence(item["sentence"])}
+    return canonical_sentence(item)
+
+
+def fan_out(result, sent, original):
+    """The record for `original` given the `result` for the item that was `sent`.
+
+    A dict item keeps its own fields and gains the ones the model added;
+    a bare sentence is put back as the record's "sentence".
+    """
+    if result is None:
+        return None
+    if isinstance(result, tuple):
+        return tuple(fan_out(part, sent, original) for part in result)
+    if not isinstance(original, dict):
+        return {**result, "sentence": original}
+    added = {
+        key: value
+        for key, value in result.items()
+        if key != "sentence" and (key not in sent or sent[key] != value)
+    }
+    return {**original, **added}
+
+
+def count_jobs(jobs, dedup=False):
+    """Number of requests `jobs` leads to, counting each verse once with `dedup`."""
+    if dedup:
+        jobs = Deduplicator(lambda idx, result: None).jobs(jobs)
+    return sum(1 for _ in jobs)
+
+
+class Deduplicator:
+    """Sends each verse once per model and copies the result to its duplicates.
+
+    Wraps a `(model, item)` job stream and the `on_result` callback it feeds.
+    `jobs` yields the first job of every `(model, verse_key)` with the
+    sentence canonicalized; `add` hands each result to `on_result` once per
+    original job, at that job's position in the input, so ordered outputs
+    keep the input order. A duplicate that turns up after its verse is done
+    is answered straight away, without a request.
+    """
+
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self.unique = dict()
+        self.sent = list()
+        self.originals = list()
+        self.results = dict()
+        self.duplicates = 0
+
+    def jobs(self, jobs):
+        for position, (model, item) in enumerate(jobs):
+            key = (
+                model,
+                verse_key(item if isinstance(item, str) else item["sentence"]),
+            )
+            if key in self.unique:
+                self.duplicates += 1
+                idx = self.unique[key]
+                self.originals[idx].append((position, item))
+                if idx in self.results:
+                    self.on_result(
+                        position, fan_out(self.results[idx], self.sent[idx], item)
+                    )
+                continue
+            self.unique[key] = len(self.sent)
+            self.sent.append(canonical_item(item))
+            self.originals.append([(position, item)])
+            yield model, self.sent[-1]
+
+    def add(self, idx, result):
+        self.results[idx] = result
+        for position, item in self.originals[idx]:
+            self.on_result(position, fan_out(result, self.sent[idx], item))
+
+    def report(self):
+        print(
+            "Deduplicated: ",
+            {"unique": len(self.sent), "duplicates": self.duplicates},
+        )
+
+
+def add_dedup_args(parser):
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Send each verse once, in canonical spelling (NFC, one danda "
+        "style), and copy its result to every duplicate; verses are matched "
+        "ignoring punctuation, diacritics and word splits.",
+    )
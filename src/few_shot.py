@@ -0,0 +1,305 @@
+import argparse
+import glob
+import json
+import os
+import re
+from collections import Counter
+
+from comparator_filter import find_comparators
+from record_io import iter_records, record_hash, signature
+from text_normalization import fold_iast, normalize_sentence
+
+
+DEFAULT_INDEX_PATH = ".few_shot_index.npz"
+DEFAULT_SOURCES = ["data/purnopama_component_identification/*.json"]
+
+COMPONENT_KEYS = ["upameya", "upamāna", "sādhāraṇadharma", "upamādyotaka"]
+
+NGRAM_RANGE = (2, 4)
+# Weight of each candidate comparator relative to the character n-grams, so
+# examples with the same upamādyotaka rank first.
+COMPARATOR_WEIGHT = 3.0
+
+# "Input: "<sentence>"" followed by the output block, as in the prompts.
+_PROMPT_EXAMPLE = re.compile(
+    r'Input: "(?P<sentence>[^\n]*)"\n(?:Explanation: [^\n]*\n)?'
+    r"Output:\s*(?P<output>.*?)(?=\n\n|\Z)",
+    re.S,
+)
+
+
+def examples_from_prompt(prompt):
+    """Parse the hand-written examples out of a system prompt.
+
+    Handles both the JSON output of the component prompt and the
+    "Key: value" lines of the construe prompt.
+    """
+    examples = list()
+    for match in _PROMPT_EXAMPLE.finditer(prompt.split("**Examples:**", 1)[-1]):
+        output = match["output"].strip()
+        if output.startswith("{"):
+            components = json.loads(output.replace("{{", "{").replace("}}", "}"))
+            examples.append({"sentence": match["sentence"], "components": components})
+            continue
+        fields = dict()
+        for line in output.splitlines():
+            key, _, value = line.partition(":")
+            fields[key.strip().lower()] = value.strip()
+        examples.append(
+            {
+                "sentence": match["sentence"],
+                "construe": fields.pop("construe", None),
+                "components": {
+                    key: fields[key] for key in COMPONENT_KEYS if key in fields
+                },
+            }
+        )
+    return examples
+
+
+def examples_from_files(patterns):
+    """Annotated pūrṇopamā records with all four components filled in."""
+    examples = list()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            for record in iter_records(path):
+                label = record.get("human_label") or record.get("label")
+                components = record.get("components") or {}
+                if label != "pūrṇopamā":
+                    continue
+                if not all(components.get(key) for key in COMPONENT_KEYS):
+                    continue
+                examples.append(
+                    {
+                        "sentence": record["sentence"],
+                        "components": {key: components[key] for key in COMPONENT_KEYS},
+                    }
+                )
+    return examples
+
+
+def source_signature(patterns, prompt_examples=()):
+    """What an index is built from, to tell when a saved one is stale.
+
+    Records the size and mtime of every source file and a hash of the
+    prompt examples.
+    """
+    paths = [path for pattern in patterns for path in sorted(glob.glob(pattern))]
+    return {
+        "files": [[path, *stat] for path, stat in zip(paths, signature(*paths))],
+        "prompt_examples": record_hash(list(prompt_examples)),
+    }
+
+
+def features(sentence):
+    """Character n-gram counts of the folded sentence, plus its comparators."""
+    text = f" {fold_iast(sentence)} "
+    counts = Counter(
+        text[i : i + n]
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1)
+        for i in range(len(text) - n + 1)
+    )
+    comparators = {span["comparator"] for span in find_comparators(sentence)}
+    return counts, comparators
+
+
+class ExampleIndex:
+    """TF-IDF index over few-shot examples for nearest-neighbour selection.
+
+    Rows are L2-normalized sublinear TF-IDF vectors of character n-grams,
+    with one extra column per comparator, so a query is a dot product over
+    the columns the query actually has. numpy is imported by the methods,
+    as every inference script imports this module for its arguments.
+    """
+
+    def __init__(self, examples, vocab, idf, matrix, sources=None):
+        self.examples = examples
+        self.vocab = vocab
+        self.idf = idf
+        self.matrix = matrix
+        self.sources = sources
+        self.keys = [normalize_sentence(example["sentence"]) for example in examples]
+
+    @classmethod
+    def build(cls, examples, sources=None):
+        import numpy as np
+
+        unique = dict()
+        for example in examples:
+            unique.setdefault(normalize_sentence(example["sentence"]), example)
+        examples = list(unique.values())
+
+        rows = [cls._terms(*features(example["sentence"])) for example in examples]
+        vocab = {
+            term: i for i, term in enumerate(sorted({t for row in rows for t in row}))
+        }
+        document_frequency = np.zeros(len(vocab))
+        for row in rows:
+            document_frequency[[vocab[term] for term in row]] += 1
+        idf = np.log((1 + len(rows)) / (1 + document_frequency)) + 1
+
+        matrix = np.zeros((len(rows), len(vocab)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            columns = [vocab[term] for term in row]
+            matrix[i, columns] = list(row.values())
+        matrix *= idf
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return cls(examples, vocab, idf.astype(np.float32), matrix, sources)
+
+    @staticmethod
+    def _terms(counts, comparators):
+        import numpy as np
+
+        terms = {ngram: 1 + np.log(count) for ngram, count in counts.items()}
+        for comparator in comparators:
+            terms[f"<{comparator}>"] = COMPARATOR_WEIGHT
+        return terms
+
+    def save(self, path):
+        import numpy as np
+
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        # Through a file object, so numpy keeps the path as given.
+        with open(path, "wb") as fp:
+            np.savez_compressed(
+                fp,
+                examples=np.array(json.dumps(self.examples, ensure_ascii=False)),
+                vocab=np.array(vocab),
+                idf=self.idf,
+                matrix=self.matrix,
+                sources=np.array(json.dumps(self.sources, ensure_ascii=False)),
+            )
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+
+        with np.load(path) as data:
+            examples = json.loads(str(data["examples"]))
+            vocab = {term: i for i, term in enumerate(data["vocab"].tolist())}
+            # Indexes saved before sources were recorded have none.
+            sources = json.loads(str(data["sources"])) if "sources" in data else None
+            return cls(examples, vocab, data["idf"], data["matrix"], sources)
+
+    def query(self, sentence, k=3, require=None):
+        """The `k` examples most similar to `sentence`, best first.
+
+        The sentence itself is never returned, and with `require` only
+        examples that have that field (e.g. "construe") are considered.
+        """
+        import numpy as np
+
+        terms = self._terms(*features(sentence))
+        columns = [self.vocab[term] for term in terms if term in self.vocab]
+        weights = np.array([terms[term] for term in terms if term in self.vocab])
+        scores = self.matrix[:, columns] @ (weights * self.idf[columns])
+
+        key = normalize_sentence(sentence)
+        ranked = [
+            i
+            for i in np.argsort(-scores, kind="stable")
+            if self.keys[i] != key
+            and (require is None or self.examples[i].get(require))
+        ]
+        return [self.examples[i] for i in ranked[:k]]
+
+
+def load_or_build_index(path, sources, prompt_examples=()):
+    """Load the index at `path`, building and saving it first if needed.
+
+    An index built from other source files, or from files changed since,
+    is rebuilt.
+    """
+    prompt_examples = list(prompt_examples)
+    current = source_signature(sources, prompt_examples)
+    if os.path.exists(path):
+        index = ExampleIndex.load(path)
+        if index.sources == current:
+            return index
+        print(f"Rebuilding {path}: its sources have changed")
+    index = ExampleIndex.build(prompt_examples + examples_from_files(sources), current)
+    index.save(path)
+    return index
+
+
+class FewShotSelector:
+    def __init__(self, index, k, require=None):
+        self.index = index
+        self.k = k
+        self.require = require
+
+    def select(self, sentence):
+        return self.index.query(sentence, self.k, self.require)
+
+
+def prompt_examples():
+    # The modules import this one, so their prompts are read lazily.
+    import construe_component_identification
+    import purnopama_component_identification
+
+    return examples_from_prompt(
+        construe_component_identification.SYSTEM_PROMPT
+    ) + examples_from_prompt(purnopama_component_identification.SYSTEM_PROMPT)
+
+
+def few_shot_from_args(args, require=None):
+    if not args.few_shot:
+        return None
+    index = load_or_build_index(
+        args.few_shot_index, args.few_shot_data, prompt_examples()
+    )
+    return FewShotSelector(index, args.few_shot, require)
+
+
+def add_few_shot_args(parser):
+    parser.add_argument(
+        "--few-shot",
+        type=int,
+        default=0,
+        metavar="K",
+        help="Replace the fixed prompt examples with the K most similar "
+        "annotated examples (0 keeps the fixed ones).",
+    )
+    parser.add_argument(
+        "--few-shot-index",
+        type=str,
+        default=DEFAULT_INDEX_PATH,
+        help="Saved example index; built from --few-shot-data if missing.",
+    )
+    parser.add_argument(
+        "--few-shot-data",
+        type=str,
+        nargs="+",
+        default=DEFAULT_SOURCES,
+        help="Annotated files the example index is built from.",
+    )
+
+
+def main(args):
+    if args.query is None:
+        examples = prompt_examples()
+        index = ExampleIndex.build(
+            examples + examples_from_files(args.data),
+            source_signature(args.data, examples),
+        )
+        index.save(args.output)
+        print(f"Indexed {len(index.examples)} examples into {args.output}")
+    else:
+        index = ExampleIndex.load(args.output)
+        for example in index.query(args.query, args.k):
+            print(json.dumps(example, ensure_ascii=False))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Build the few-shot example index, or query it."
+    )
+    parser.add_argument("-o", "--output", type=str, default=DEFAULT_INDEX_PATH)
+    parser.add_argument("-d", "--data", type=str, nargs="+", default=DEFAULT_SOURCES)
+    parser.add_argument("-q", "--query", type=str, default=None)
+    parser.add_argument("-k", type=int, default=3)
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -0,0 +1,139 @@
+import re
+
+
+# Longest value, in characters, accepted for each output field. In the
+# annotated data the longest component is 25 characters and 99% of the
+# reasons are under 600.
+FIELD_LENGTHS = {
+    "reason": 600,
+    "construe": 400,
+    "upameya": 64,
+    "upamāna": 64,
+    "sādhāraṇadharma": 64,
+    "upamādyotaka": 32,
+}
+
+LABELS = ["Pūrṇopamā", "Luptopamā", "None"]
+
+COMPONENT_KEYS = ["upameya", "upamāna", "sādhāraṇadharma", "upamādyotaka"]
+
+# Budget one token per character: the Llama 3 vocabulary has single tokens
+# for the IAST letters, so no character costs more than one.
+TOKENS_PER_CHAR = 1
+
+# Room for whitespace the grammar allows between JSON tokens and for EOS.
+SLACK_TOKENS = 16
+
+DEFAULT_MAX_TOKENS = 1024
+
+# Unguided budgets for tasks whose answer is short whatever the model does.
+UNGUIDED_MAX_TOKENS = {"classification-label-only": 64}
+
+
+def string_field(key):
+    return {"type": "string", "minLength": 1, "maxLength": FIELD_LENGTHS[key]}
+
+
+def object_schema(properties):
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+LABEL_FIELD = {"type": "string", "enum": LABELS}
+
+CLASSIFICATION_SCHEMA = object_schema(
+    {"reason": string_field("reason"), "label": LABEL_FIELD}
+)
+
+# The schemas fix the field order too, so the label can be read off the
+# start of the completion.
+LABEL_FIRST_SCHEMA = object_schema(
+    {"label": LABEL_FIELD, "reason": string_field("reason")}
+)
+
+LABEL_ONLY_SCHEMA = object_schema({"label": LABEL_FIELD})
+
+COMPONENTS_SCHEMA = object_schema({key: string_field(key) for key in COMPONENT_KEYS})
+
+
+def construe_regex():
+    """Regex for the line format read by `parse_string_to_dict`."""
+    return r"\n".join(
+        f"{re.escape(key.capitalize())}: [^\\n]{{1,{FIELD_LENGTHS[key]}}}"
+        for key in ["construe"] + COMPONENT_KEYS
+    )
+
+
+CONSTRUE_REGEX = construe_regex()
+
+
+def max_chars(schema):
+    """Upper bound on the length of a compact JSON document matching `schema`."""
+    if "enum" in schema:
+        return max(len(f'"{value}"') for value in schema["enum"])
+    if schema["type"] == "string":
+        return schema["maxLength"] + 2
+    # Braces, plus per field a quoted key, ": " and ", ".
+    return 2 + sum(
+        len(key) + 6 + max_chars(value) for key, value in schema["properties"].items()
+    )
+
+
+def max_tokens_for_schema(schema):
+    return max_chars(schema) * TOKENS_PER_CHAR + SLACK_TOKENS
+
+
+def max_tokens_for_lines(keys):
+    # "Key: value" per line, plus the newline.
+    chars = sum(len(key) + 3 + FIELD_LENGTHS[key] for key in keys)
+    return chars * TOKENS_PER_CHAR + SLACK_TOKENS
+
+
+GUIDES = {
+    "classification": (
+        {"guided_json": CLASSIFICATION_SCHEMA},
+        max_tokens_for_schema(CLASSIFICATION_SCHEMA),
+    ),
+    "classification-label-first": (
+        {"guided_json": LABEL_FIRST_SCHEMA},
+        max_tokens_for_schema(LABEL_FIRST_SCHEMA),
+    ),
+    "classification-label-only": (
+        {"guided_json": LABEL_ONLY_SCHEMA},
+        max_tokens_for_schema(LABEL_ONLY_SCHEMA),
+    ),
+    "components": (
+        {"guided_json": COMPONENTS_SCHEMA},
+        max_tokens_for_schema(COMPONENTS_SCHEMA),
+    ),
+    "construe": (
+        {"guided_regex": CONSTRUE_REGEX},
+        max_tokens_for_lines(["construe"] + COMPONENT_KEYS),
+    ),
+}
+
+
+def request_options(task, guided=False):
+    """Extra `chat` arguments for `task`.
+
+    With `guided`, the vLLM server constrains decoding to the task's JSON
+    schema or regex (passed through `extra_body`), so every completion
+    parses, and `max_tokens` is the longest output the constraint allows.
+    """
+    if not guided:
+        return {"max_tokens": UNGUIDED_MAX_TOKENS.get(task, DEFAULT_MAX_TOKENS)}
+    extra_body, max_tokens = GUIDES[task]
+    return {"extra_body": extra_body, "max_tokens": max_tokens}
+
+
+def add_guided_args(parser):
+    parser.add_argument(
+        "--guided",
+        action="store_true",
+        help="Constrain outputs to the task's JSON schema/regex (vLLM guided "
+        "decoding) and derive max_tokens from it.",
+    )
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from collections import Counter
+
+from record_io import is_jsonl, iter_jsonl_lines, iter_records, signature
+
+
+class EvalState:
+    """Per-record match vectors and running totals kept between eval runs.
+
+    Stored as JSON at `path`, with one entry per evaluated input: the file
+    signature and options it was computed with, the record hashes in input
+    order, the vector of every distinct hash and the totals of those vectors.
+    An input whose signature is unchanged is not opened again. A changed one
+    is diffed by record hash, and only the records added or removed touch the
+    totals; for JSONL inputs the record hash of every line is kept as well,
+    so only new or edited lines are decoded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = dict()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as fp:
+                self.entries = json.load(fp)
+
+    def fresh(self, key, files, options=None):
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and entry["signature"] == signature(*files)
+            and entry["options"] == options
+        )
+
+    def record_hashes(
+        self, key, path, hash_record, columns=None, context=None, options=None
+    ):
+        """Hash every record of `path` with `hash_record(record)`, in order.
+
+        `hash_record` returns None for a record to leave out. A JSONL line
+        whose bytes are unchanged since the last run for `key` reuses its
+        stored hash without being decoded; other formats are decoded in
+        full. `context` is whatever else the hashes depend on, such as the
+        gold file's signature; if it or `options` changed, every line is
+        decoded again. Returns the hashes and the line map to pass on to
+        `update`.
+        """
+        entry = self.entries.get(key) or {}
+        previous = entry.get("lines") or {}
+        known = dict()
+        if entry.get("options") == options and previous.get("context") == context:
+            known = previous.get("hashes", {})
+        if not is_jsonl(path):
+            hashes = [
+                hash_record(record) for record in iter_records(path, columns=columns)
+            ]
+            return hashes, None
+        lines = dict()
+        hashes = list()
+        for line in iter_jsonl_lines(path):
+            digest = hashlib.blake2b(line, digest_size=16).hexdigest()
+            if digest not in lines:
+                if digest in known:
+                    lines[digest] = known[digest]
+                else:
+                    lines[digest] = hash_record(json.loads(line))
+            hashes.append(lines[digest])
+        return hashes, {"context": context, "hashes": lines}
+
+    def update(
+        self,
+        key,
+        files,
+        hashes,
+        vectorize,
+        accumulate,
+        totals,
+        options=None,
+        lines=None,
+    ):
+        """Bring the entry for `key` up to date with the records `hashes`.
+
+        `vectorize(missing)` returns the vectors of hashes not stored yet,
+        `accumulate(totals, vector, count)` adds a vector `count` times
+        (negative to remove it) and `totals()` makes empty totals. `lines`
+        is the line map from `record_hashes`. Returns the entry and the
+        (added, removed) record counts.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry["options"] != options:
+            entry = {"order": [], "vectors": {}, "totals": totals()}
+        old, new = Counter(entry["order"]), Counter(hashes)
+        removed, added = old - new, new - old
+
+        vectors = entry["vectors"]
+        vectors.update(vectorize([h for h in added if h not in vectors]))
+        for h, count in removed.items():
+            accumulate(entry["totals"], vectors[h], -count)
+        for h, count in added.items():
+            accumulate(entry["totals"], vectors[h], count)
+
+        entry.update(
+            signature=signature(*files),
+            options=options,
+            order=list(hashes),
+            vectors={h: vectors[h] for h in new},
+            lines=lines or {},
+        )
+        self.entries[key] = entry
+        return entry, sum(added.values()), sum(removed.values())
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as fp:
+            json.dump(self.entries, fp, ensure_ascii=False)
+
+
+def report_diff(name, added=None, removed=None):
+    if added is None:
+        print(f"{name}: unchanged")
+    else:
+        print(f"{name}: {added} records added, {removed} removed")
@@ -0,0 +1,658 @@
+import asyncio
+import random
+import threading
+import time
+
+from perf_metrics import RunMetrics, StreamAccumulator
+from response_cache import DEFAULT_CACHE_PATH, ResponseCache, request_key
+
+
+DEFAULT_BASE_URL = "http://localhost:8000/v1"
+DEFAULT_API_KEY = "token-123"
+DEFAULT_MODEL_NAME = "/home/himanshu.dutta/hf_models/llama-3.1-8b-instruct/"
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by the sync and async code paths.
+
+    `rate` tokens are added per second up to `capacity`; every request takes
+    one token. A rate of None or 0 disables limiting.
+    """
+
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate or 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token and return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        if not self.rate:
+            return
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        if not self.rate:
+            return
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def is_retryable(exc):
+    import openai
+
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+class Endpoint:
+    """One OpenAI-compatible server serving `model`, with lazily built clients.
+
+    `outstanding` counts requests currently in flight to this endpoint and
+    `served` the requests sent so far; the client uses both to pick the
+    least loaded replica.
+    """
+
+    def __init__(self, base_url, model, api_key, timeout, limits):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.limits = limits
+        self.outstanding = 0
+        self.served = 0
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import DefaultHttpxClient, OpenAI
+
+            self._client = OpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=DefaultHttpxClient(
+                    limits=self.limits, timeout=self.timeout
+                ),
+            )
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            self._async_client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=self.limits, timeout=self.timeout
+                ),
+            )
+        return self._async_client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+
+class LLMClient:
+    """OpenAI-compatible chat client with pooling, retries and rate limiting.
+
+    `endpoints` is a list of `(base_url, model)` pairs; several pairs with the
+    same model are replicas, and each request goes to the replica of its
+    model with the fewest outstanding requests. Every endpoint holds a
+    keep-alive connection pool for its sync client and another for its async
+    client; both are created on first use. Retries use exponential backoff
+    with full jitter on connection errors, timeouts, 429 and 5xx responses
+    and re-pick the replica on every attempt. Everything else is raised to
+    the caller. If a `ResponseCache` is given, identical requests to the
+    same endpoints are answered from it without touching the server.
+
+    Every request is timed and its token usage recorded in `metrics`. With
+    `stream`, completions are streamed and reassembled so time-to-first-token
+    can be measured as well. A request made with `stop_when` is always
+    streamed, and the stream is closed as soon as `stop_when(content)` is
+    true for every choice, so the server stops generating; the response
+    then holds the content received so far.
+
+    Prompts are always sent as the same system message followed by the user
+    message, so the system prompt is a byte-identical prefix across requests
+    and the server's automatic prefix cache can reuse it. `prefix_warmup`
+    asks the async runners to complete one request before the rest so that
+    prefix is cached before concurrent requests arrive.
+    """
+
+    def __init__(
+        self,
+        endpoints=((DEFAULT_BASE_URL, DEFAULT_MODEL_NAME),),
+        api_key=DEFAULT_API_KEY,
+        timeout=120.0,
+        connect_timeout=10.0,
+        max_connections=64,
+        max_keepalive_connections=32,
+        max_retries=5,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        rate_limit=None,
+        cache=None,
+        prefix_warmup=False,
+        stream=False,
+    ):
+        # openai takes most of the import time of the scripts, so it is only
+        # imported once a client is built. Its HTTP types come through openai
+        # rather than the HTTP library, whose package name varies by version.
+        import openai
+
+        timeout = openai.Timeout(timeout, connect=connect_timeout)
+        limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.endpoints = [
+            Endpoint(base_url, model, api_key, timeout, limits)
+            for base_url, model in endpoints
+        ]
+        self.models = list(dict.fromkeys(endpoint.model for endpoint in self.endpoints))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.cache = cache
+        self.prefix_warmup = prefix_warmup
+        self.stream = stream
+        self.metrics = RunMetrics()
+
+    def _pick(self, model):
+        return min(
+            (endpoint for endpoint in self.endpoints if endpoint.model == model),
+            key=lambda endpoint: (endpoint.outstanding, endpoint.served),
+        )
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _prepare(self, messages, kwargs, stop_when=None):
+        """Resolve the model and look the request up in the response cache."""
+        kwargs["model"] = kwargs.get("model") or self.models[0]
+        if kwargs["model"] not in self.models:
+            raise ValueError(f"No endpoint serves model {kwargs['model']!r}")
+        request = {"messages": messages, **kwargs}
+        if self.cache is None or not self.cache.accepts(request):
+            return None, None
+        if stop_when is not None:
+            # A stream cut short is cached apart from the whole completion.
+            request["stopped_early"] = True
+        # Servers that share a model name may still serve different weights.
+        request["endpoints"] = sorted(
+            endpoint.base_url
+            for endpoint in self.endpoints
+            if endpoint.model == kwargs["model"]
+        )
+        key = request_key(request)
+        return key, self.cache.get(key)
+
+    def _stream_kwargs(self, kwargs):
+        return {**kwargs, "stream": True, "stream_options": {"include_usage": True}}
+
+    def _create(self, endpoint, messages, kwargs, stop_when=None):
+        if not self.stream and stop_when is None:
+            return (
+                endpoint.client.chat.completions.create(messages=messages, **kwargs),
+                None,
+            )
+        accumulator = StreamAccumulator(time.perf_counter())
+        stream = endpoint.client.chat.completions.create(
+            messages=messages, **self._stream_kwargs(kwargs)
+        )
+        try:
+            for chunk in stream:
+                accumulator.add(chunk)
+                if stop_when is not None and accumulator.satisfied(
+                    stop_when, kwargs.get("n", 1)
+                ):
+                    accumulator.stopped = True
+                    break
+        finally:
+            # Closing the connection mid-stream makes vLLM abort the request.
+            stream.close()
+        return accumulator.completion(), accumulator
+
+    async def _acreate(self, endpoint, messages, kwargs, stop_when=None):
+        if not self.stream and stop_when is None:
+            response = await endpoint.async_client.chat.completions.create(
+                messages=messages, **kwargs
+            )
+            return response, None
+        accumulator = StreamAccumulator(time.perf_counter())
+        stream = await endpoint.async_client.chat.completions.create(
+            messages=messages, **self._stream_kwargs(kwargs)
+        )
+        try:
+            async for chunk in stream:
+                accumulator.add(chunk)
+                if stop_when is not None and accumulator.satisfied(
+                    stop_when, kwargs.get("n", 1)
+                ):
+                    accumulator.stopped = True
+                    break
+        finally:
+            await stream.close()
+        return accumulator.completion(), accumulator
+
+    def chat(self, messages, stop_when=None, **kwargs):
+        called = time.perf_counter()
+        key, cached = self._prepare(messages, kwargs, stop_when)
+        if cached is not None:
+            self.metrics.add_cache_hit()
+            return cached
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            endpoint = self._pick(kwargs["model"])
+            endpoint.outstanding += 1
+            endpoint.served += 1
+            dispatched = time.perf_counter()
+            try:
+                response, stream = self._create(endpoint, messages, kwargs, stop_when)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.metrics.add_request(
+                        kwargs["model"],
+                        endpoint.base_url,
+                        called,
+                        dispatched,
+                        attempt,
+                        error=e,
+                    )
+                    raise
+            finally:
+                endpoint.outstanding -= 1
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+        self.metrics.add_request(
+            kwargs["model"],
+            endpoint.base_url,
+            called,
+            dispatched,
+            attempt,
+            response=response,
+            stream=stream,
+        )
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+    async def achat(self, messages, stop_when=None, **kwargs):
+        called = time.perf_counter()
+        key, cached = self._prepare(messages, kwargs, stop_when)
+        if cached is not None:
+            self.metrics.add_cache_hit()
+            return cached
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire_async()
+            endpoint = self._pick(kwargs["model"])
+            endpoint.outstanding += 1
+            endpoint.served += 1
+            dispatched = time.perf_counter()
+            try:
+                response, stream = await self._acreate(
+                    endpoint, messages, kwargs, stop_when
+                )
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.metrics.add_request(
+                        kwargs["model"],
+                        endpoint.base_url,
+                        called,
+                        dispatched,
+                        attempt,
+                        error=e,
+                    )
+                    raise
+            finally:
+                endpoint.outstanding -= 1
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+        self.metrics.add_request(
+            kwargs["model"],
+            endpoint.base_url,
+            called,
+            dispatched,
+            attempt,
+            response=response,
+            stream=stream,
+        )
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+    def report(self, output_path=None):
+        """Print usage and cache stats; with `output_path`, write the perf report."""
+        print("Token usage: ", self.metrics.usage())
+        if output_path is not None:
+            self.metrics.write(output_path)
+        if self.cache is not None:
+            print("Response cache: ", self.cache.stats())
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            await endpoint.aclose()
+
+
+async def run_bounded(
+    items, fn, max_in_flight, on_result, total=None, warmup=False, postprocess=None
+):
+    """Apply coroutine `fn` to every item with at most `max_in_flight` running.
+
+    Items are fed to a fixed pool of workers through a bounded queue, so the
+    producer blocks (backpressure) instead of materialising one task per
+    item. `items` may be a lazy iterator; it is consumed only as workers free
+    up. Each result is handed to `on_result(idx, result)` as soon as it is
+    ready, with `idx` the item's input position. `total` is the number of
+    items for the progress bar; it defaults to `len(items)` when there is one.
+
+    With `postprocess`, each result of `fn` goes through a second bounded
+    queue to coroutine `postprocess` before `on_result`, so a worker takes
+    its next item as soon as its request is done rather than after parsing.
+
+    With `warmup`, the first item is processed on its own before any other
+    request is dispatched, so a shared prompt prefix is already in the
+    server's prefix cache when the concurrent requests arrive.
+
+    An exception from `fn`, `postprocess` or `on_result` stops the run and
+    is raised to the caller.
+    """
+    from tqdm import tqdm
+
+    queue = asyncio.Queue(maxsize=max_in_flight)
+    post_queue = asyncio.Queue(maxsize=max_in_flight)
+    if total is None and hasattr(items, "__len__"):
+        total = len(items)
+    progress = tqdm(total=total)
+    items = enumerate(items)
+
+    async def finish(idx, result):
+        if postprocess is not None:
+            result = await postprocess(result)
+        on_result(idx, result)
+
+    if warmup:
+        for idx, item in items:
+            await finish(idx, await fn(item))
+            progress.update(1)
+            break
+
+    async def worker():
+        while True:
+            idx, item = await queue.get()
+            try:
+                result = await fn(item)
+                if postprocess is None:
+                    on_result(idx, result)
+                else:
+                    await post_queue.put((idx, result))
+            finally:
+                progress.update(1)
+                queue.task_done()
+
+    async def post_worker():
+        while True:
+            idx, result = await post_queue.get()
+            try:
+                await finish(idx, result)
+            finally:
+                post_queue.task_done()
+
+    async def feed():
+        for idx, item in items:
+            await queue.put((idx, item))
+        await queue.join()
+        await post_queue.join()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max_in_flight)]
+    if postprocess is not None:
+        workers += [asyncio.create_task(post_worker()) for _ in range(max_in_flight)]
+    tasks = [asyncio.create_task(feed())] + workers
+    try:
+        # Workers only stop by raising, so this returns once everything is
+        # fed and done or as soon as a worker fails; the error is re-raised
+        # rather than leaving the feeder blocked on a queue nobody drains.
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        progress.close()
+
+
+def add_client_args(parser):
+    group = parser.add_argument_group("LLM client")
+    group.add_argument(
+        "--backend",
+        choices=["http", "vllm", "llama.cpp"],
+        default="http",
+        help="http talks to an OpenAI-compatible server; vllm and llama.cpp "
+        "load --model in-process and batch the requests (offline, no server); "
+        "they keep --engine-batch-size requests in flight, ignoring "
+        "--async-mode and --batch-size.",
+    )
+    group.add_argument(
+        "--engine-arg",
+        type=str,
+        action="append",
+        default=None,
+        metavar="KEY=VALUE",
+        help="Keyword argument for the offline engine, e.g. "
+        "max_model_len=4096 or n_ctx=8192; repeatable.",
+    )
+    group.add_argument(
+        "--engine-batch-size",
+        type=int,
+        default=256,
+        help="Requests kept in flight for an offline engine; the ones queued "
+        "while it generates form its next batch.",
+    )
+    group.add_argument(
+        "--endpoint",
+        type=str,
+        action="append",
+        default=None,
+        help="Server as [MODEL=]URL; repeat for replicas or other models. "
+        "Without MODEL the endpoint serves every --model. Defaults to "
+        f"{DEFAULT_BASE_URL}.",
+    )
+    group.add_argument("--api-key", type=str, default=DEFAULT_API_KEY)
+    group.add_argument(
+        "--model",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Model(s) to run; with several, every sentence is sent to each "
+        "model and results are tagged and written per model. Defaults to the "
+        f"models named in --endpoint, or {DEFAULT_MODEL_NAME}.",
+    )
+    group.add_argument(
+        "--timeout", type=float, default=120.0, help="Read timeout in seconds."
+    )
+    group.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=10.0,
+        help="Connect timeout in seconds.",
+    )
+    group.add_argument(
+        "--max-connections",
+        type=int,
+        default=64,
+        help="Size of the keep-alive connection pool.",
+    )
+    group.add_argument(
+        "--max-retries",
+        type=int,
+        default=5,
+        help="Retries on connection errors, timeouts, 429 and 5xx responses.",
+    )
+    group.add_argument(
+        "--rate-limit",
+        type=float,
+        default=None,
+        help="Maximum requests per second (token bucket); unlimited by default.",
+    )
+    group.add_argument(
+        "--cache-path",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file caching responses by request hash.",
+    )
+    group.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=100_000,
+        help="Least recently used responses are evicted beyond this size.",
+    )
+    group.add_argument(
+        "--cache-sampled",
+        action="store_true",
+        help="Also cache sampled requests (temperature above 0 or --samples "
+        "above 1), so reruns return the same samples instead of new ones.",
+    )
+    group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the response cache for both reads and writes.",
+    )
+    group.add_argument(
+        "--prefix-warmup",
+        action="store_true",
+        help="In async mode, finish one request before dispatching the rest so "
+        "they hit the server's prefix cache for the shared system prompt.",
+    )
+    group.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions so time-to-first-token is measured.",
+    )
+    return parser
+
+
+def parse_endpoints(specs, models=None):
+    """`(base_url, model)` pairs for the --endpoint specs and --model list.
+
+    A `MODEL=URL` spec serves that model and a bare URL every model. Without
+    `models`, the models are the ones the specs name, or the default model.
+    Raises ValueError if a model has no endpoint, rather than dropping it.
+    """
+    parsed = list()
+    for spec in specs or [DEFAULT_BASE_URL]:
+        model, sep, base_url = spec.partition("=")
+        if sep and "://" not in model:
+            parsed.append((base_url, model))
+        else:
+            parsed.append((spec, None))
+    if not models:
+        models = [model for _, model in parsed if model is not None]
+        models = list(dict.fromkeys(models)) or [DEFAULT_MODEL_NAME]
+    endpoints = list()
+    for base_url, model in parsed:
+        if model is not None:
+            endpoints.append((base_url, model))
+        else:
+            endpoints.extend((base_url, model) for model in models)
+    served = {model for _, model in endpoints}
+    missing = [model for model in models if model not in served]
+    if missing:
+        raise ValueError(
+            f"No --endpoint serves {', '.join(missing)}; add MODEL=URL for it "
+            "or a URL without a model"
+        )
+    return endpoints
+
+
+def dispatch_from_args(args, jobs):
+    """Return `(jobs, max_in_flight, async_mode)` for a run.
+
+    An offline backend batches every request queued while its engine is
+    busy, so it always runs async with --engine-batch-size requests in
+    flight, whatever --async-mode and --batch-size say. Jobs stay a lazy
+    stream either way. Scripts without --async-mode always run async.
+    """
+    if args.backend == "http":
+        return jobs, args.batch_size, getattr(args, "async_mode", True)
+    return jobs, args.engine_batch_size, True
+
+
+def client_from_args(args):
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(
+            args.cache_path,
+            max_entries=args.cache_max_entries,
+            sampled=args.cache_sampled,
+        )
+    if args.backend != "http":
+        from offline_backend import OfflineClient, parse_engine_args
+
+        return OfflineClient(
+            args.backend,
+            args.model or [DEFAULT_MODEL_NAME],
+            parse_engine_args(args.engine_arg),
+            cache=cache,
+        )
+    return LLMClient(
+        endpoints=parse_endpoints(args.endpoint, args.model),
+        api_key=args.api_key,
+        timeout=args.timeout,
+        connect_timeout=args.connect_timeout,
+        max_connections=args.max_connections,
+        max_keepalive_connections=args.max_connections,
+        max_retries=args.max_retries,
+        rate_limit=args.rate_limit,
+        cache=cache,
+        prefix_warmup=args.prefix_warmup,
+        stream=args.stream,
+    )
@@ -0,0 +1,336 @@
+import argparse
+import glob
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+INPUT_PATTERN = re.compile(r"Input:\s*(.*?)\s*\nOutput:", re.S)
+OUTPUT_FORMAT_PATTERN = re.compile(r"^Output Format:\s*(.*)", re.M)
+
+
+def load_canned_responses(data_dir="data"):
+    """Build canned completions per task from the annotated data files.
+
+    Classification answers come from `upma_classification/*.json`
+    (`reasoning`, `system_label`) and component answers from
+    `purnopama_component_identification/*.json` (`components`), keyed by
+    sentence. Construe answers reuse the components in the line format that
+    `parse_string_to_dict` expects.
+    """
+    canned = {"classification": {}, "components": {}, "construe": {}}
+    for path in glob.glob(f"{data_dir}/upma_classification/*.json"):
+        with open(path, "r", encoding="utf-8") as fp:
+            for item in json.load(fp):
+                canned["classification"][item["sentence"]] = json.dumps(
+                    {"reason": item["reasoning"], "label": item["system_label"]},
+                    ensure_ascii=False,
+                )
+    for path in glob.glob(f"{data_dir}/purnopama_component_identification/*.json"):
+        with open(path, "r", encoding="utf-8") as fp:
+            for item in json.load(fp):
+                components = item.get("components") or {}
+                canned["components"][item["sentence"]] = json.dumps(
+                    components, ensure_ascii=False
+                )
+                canned["construe"][item["sentence"]] = "\n".join(
+                    [f"Construe: {item['sentence']}"]
+                    + [
+                        f"{key.capitalize()}: {value}"
+                        for key, value in components.items()
+                    ]
+                )
+    return canned
+
+
+def task_of(system_prompt):
+    if "construe" in system_prompt:
+        return "construe"
+    if "identify the essential elements" in system_prompt:
+        return "components"
+    return "classification"
+
+
+def reorder_fields(content, system_prompt):
+    """Give a JSON answer the fields, in order, of the prompt's output format."""
+    match = OUTPUT_FORMAT_PATTERN.search(system_prompt)
+    if match is None:
+        return content
+    fields = re.findall(r'"(\w+)":', match.group(1))
+    if not fields:
+        return content
+    answer = json.loads(content)
+    return json.dumps(
+        {field: answer[field] for field in fields if field in answer},
+        ensure_ascii=False,
+    )
+
+
+def sample(spec):
+    """Draw a duration in seconds from "fixed:a", "uniform:a:b" or "lognormal:mu:sigma"."""
+    kind, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return random.uniform(*params)
+    if kind == "lognormal":
+        return random.lognormvariate(*params)
+    raise ValueError(f"Unknown distribution: {spec}")
+
+
+class MockServer:
+    """OpenAI-compatible stand-in for the vLLM server used by the scripts.
+
+    Serves `/v1/chat/completions` (plain and streamed) with a time to first
+    token drawn from `ttft` and output produced at `tokens_per_sec`, so
+    client-side throughput can be measured without a GPU. `error_rate` of the
+    requests fail with HTTP 503 to exercise retries. Prompt tokens are
+    approximated as characters / 4, and a system prompt seen before is
+    reported as cached, mimicking automatic prefix caching.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        ttft="fixed:0.05",
+        tokens_per_sec=200.0,
+        error_rate=0.0,
+        data_dir="data",
+    ):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.canned = load_canned_responses(data_dir)
+        self.seen_prefixes = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def respond(self, body):
+        messages = body["messages"]
+        system_prompt = messages[0]["content"]
+        task = task_of(system_prompt)
+        # Few-shot prompts carry example inputs first; the sentence is last.
+        matches = INPUT_PATTERN.findall(messages[-1]["content"])
+        sentence = matches[-1].strip() if matches else ""
+        canned = self.canned[task]
+        content = canned.get(sentence)
+        if content is None:
+            content = random.choice(list(canned.values())) if canned else "{}"
+        if task == "classification":
+            # Label-first and label-only prompts get the canned answer to match.
+            content = reorder_fields(content, system_prompt)
+
+        with self.lock:
+            self.requests += 1
+            cached = system_prompt in self.seen_prefixes
+            self.seen_prefixes.add(system_prompt)
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        completion_tokens = max(1, len(content) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {
+                "cached_tokens": len(system_prompt) // 4 if cached else 0
+            },
+        }
+        return content, usage
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # Headers, body and stream events go out as separate writes;
+                # with Nagle's algorithm the delayed ACK of the client would
+                # hold each one back by ~40 ms on keep-alive connections.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _send(self, status, payload, content_type="application/json"):
+                data = payload.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send(200, json.dumps({"object": "list", "data": []}))
+                else:
+                    self._send(404, "{}")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, "{}")
+                    return
+                if random.random() < server.error_rate:
+                    time.sleep(sample(server.ttft))
+                    self._send(503, json.dumps({"error": "mock overload"}))
+                    return
+                content, usage = server.respond(body)
+                if body.get("stream"):
+                    self._stream(body, content, usage)
+                else:
+                    self._complete(body, content, usage)
+
+            def _complete(self, body, content, usage):
+                n = body.get("n") or 1
+                time.sleep(
+                    sample(server.ttft)
+                    + usage["completion_tokens"] / server.tokens_per_sec
+                )
+                self._send(
+                    200,
+                    json.dumps(
+                        {
+                            "id": f"chatcmpl-{uuid.uuid4().hex}",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": body["model"],
+                            "choices": [
+                                {
+                                    "index": index,
+                                    "message": {
+                                        "role": "assistant",
+                                        "content": content,
+                                    },
+                                    "finish_reason": "stop",
+                                }
+                                for index in range(n)
+                            ],
+                            "usage": usage,
+                        },
+                        ensure_ascii=False,
+                    ),
+                )
+
+            def _event(self, payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, body, content, usage):
+                chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+                n = body.get("n") or 1
+
+                def chunk(choices, **extra):
+                    return json.dumps(
+                        {
+                            "id": chunk_id,
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": body["model"],
+                            "choices": choices,
+                            **extra,
+                        },
+                        ensure_ascii=False,
+                    )
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(sample(server.ttft))
+                try:
+                    for start in range(0, len(content), 4):
+                        self._event(
+                            chunk(
+                                [
+                                    {
+                                        "index": index,
+                                        "delta": {
+                                            "content": content[start : start + 4]
+                                        },
+                                        "finish_reason": None,
+                                    }
+                                    for index in range(n)
+                                ]
+                            )
+                        )
+                        time.sleep(1 / server.tokens_per_sec)
+                    self._event(
+                        chunk(
+                            [
+                                {"index": index, "delta": {}, "finish_reason": "stop"}
+                                for index in range(n)
+                            ]
+                        )
+                    )
+                    stream_options = body.get("stream_options") or {}
+                    if stream_options.get("include_usage"):
+                        self._event(chunk([], usage=usage))
+                    self._event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream early.
+                    self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main(args):
+    server = MockServer(
+        args.host,
+        args.port,
+        ttft=args.ttft,
+        tokens_per_sec=args.tokens_per_sec,
+        error_rate=args.error_rate,
+        data_dir=args.data_dir,
+    )
+    print(f"Serving mock completions on {server.base_url}")
+    server.httpd.serve_forever()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Serve canned OpenAI-compatible chat completions for benchmarks."
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--ttft",
+        type=str,
+        default="fixed:0.05",
+        help='Time to first token: "fixed:s", "uniform:a:b" or "lognormal:mu:sigma".',
+    )
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--data-dir", type=str, default="data")
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
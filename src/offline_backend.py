@@ -0,0 +1,281 @@
+import asyncio
+import json
+import time
+from itertools import groupby
+
+from perf_metrics import RunMetrics
+from response_cache import request_key
+
+
+class VLLMEngine:
+    """Batched chat generation on an in-process `vllm.LLM`."""
+
+    def __init__(self, model, **engine_args):
+        from vllm import LLM
+
+        self.llm = LLM(model=model, **engine_args)
+
+    @staticmethod
+    def sampling_params(kwargs):
+        from vllm import SamplingParams
+
+        options = {
+            key: kwargs[key]
+            for key in ("temperature", "max_tokens", "n")
+            if key in kwargs
+        }
+        # guided_json / guided_regex, as sent to the server in `extra_body`.
+        guide = {
+            key.removeprefix("guided_"): value
+            for key, value in kwargs.get("extra_body", {}).items()
+            if key.startswith("guided_")
+        }
+        if guide:
+            try:
+                from vllm.sampling_params import GuidedDecodingParams
+
+                options["guided_decoding"] = GuidedDecodingParams(**guide)
+            except ImportError:
+                # Renamed in later vLLM releases.
+                from vllm.sampling_params import StructuredOutputsParams
+
+                options["structured_outputs"] = StructuredOutputsParams(**guide)
+        return SamplingParams(**options)
+
+    def generate(self, requests):
+        outputs = self.llm.chat(
+            [messages for messages, _ in requests],
+            [self.sampling_params(kwargs) for _, kwargs in requests],
+            use_tqdm=False,
+        )
+        return [
+            {
+                "contents": [choice.text for choice in output.outputs],
+                "finish_reasons": [
+                    choice.finish_reason or "stop" for choice in output.outputs
+                ],
+                "prompt_tokens": len(output.prompt_token_ids or []),
+                "completion_tokens": sum(
+                    len(choice.token_ids) for choice in output.outputs
+                ),
+            }
+            for output in outputs
+        ]
+
+
+class LlamaCppEngine:
+    """Chat generation with llama-cpp-python, e.g. a GGUF model on CPU.
+
+    llama.cpp takes one prompt per call, so a batch runs sequentially; it
+    still saves the HTTP round trips and the server process. JSON schemas are
+    enforced through a grammar; regex guides have no llama.cpp equivalent
+    and are dropped.
+    """
+
+    def __init__(self, model, **engine_args):
+        from llama_cpp import Llama
+
+        engine_args.setdefault("verbose", False)
+        self.llm = Llama(model_path=model, **engine_args)
+
+    def generate_one(self, messages, kwargs):
+        options = {
+            key: kwargs[key] for key in ("temperature", "max_tokens") if key in kwargs
+        }
+        schema = kwargs.get("extra_body", {}).get("guided_json")
+        if schema is not None:
+            options["response_format"] = {"type": "json_object", "schema": schema}
+        # No `n`: the samples are drawn one by one.
+        responses = [
+            self.llm.create_chat_completion(messages=messages, **options)
+            for _ in range(kwargs.get("n", 1))
+        ]
+        return {
+            "contents": [r["choices"][0]["message"]["content"] for r in responses],
+            "finish_reasons": [
+                r["choices"][0]["finish_reason"] or "stop" for r in responses
+            ],
+            "prompt_tokens": responses[0]["usage"]["prompt_tokens"],
+            "completion_tokens": sum(
+                r["usage"]["completion_tokens"] for r in responses
+            ),
+        }
+
+    def generate(self, requests):
+        return [self.generate_one(messages, kwargs) for messages, kwargs in requests]
+
+
+ENGINES = {"vllm": VLLMEngine, "llama.cpp": LlamaCppEngine}
+
+
+def completion(model, result):
+    """Wrap an engine result as the `ChatCompletion` the HTTP client returns."""
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(
+        {
+            "id": "",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": index,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }
+                for index, (content, finish_reason) in enumerate(
+                    zip(result["contents"], result["finish_reasons"])
+                )
+            ],
+            "usage": {
+                "prompt_tokens": result["prompt_tokens"],
+                "completion_tokens": result["completion_tokens"],
+                "total_tokens": result["prompt_tokens"] + result["completion_tokens"],
+            },
+        }
+    )
+
+
+def parse_engine_args(specs):
+    """KEY=VALUE pairs to keyword arguments; values are JSON where they parse."""
+    engine_args = dict()
+    for spec in specs or []:
+        key, _, value = spec.partition("=")
+        try:
+            engine_args[key.replace("-", "_")] = json.loads(value)
+        except ValueError:
+            engine_args[key.replace("-", "_")] = value
+    return engine_args
+
+
+class OfflineClient:
+    """In-process stand-in for `LLMClient` that runs a batch engine.
+
+    Takes the same `chat`/`achat` calls, so prompts, parsers, sinks and
+    metrics are shared with the HTTP path, but no server is involved. `achat`
+    calls are queued, and every call made while the engine is busy or in the
+    same pass of the event loop goes to the engine as one batch. The scripts
+    keep --engine-batch-size requests in flight for this client
+    (`dispatch_from_args`), fed lazily from the input, so each `generate`
+    call gets up to that many prompts per model. `chat` runs a batch of one.
+    Batch engines return whole completions, so `stop_when` is ignored.
+
+    Engines are loaded on first use, one per model.
+    """
+
+    def __init__(self, backend, models, engine_args=None, cache=None):
+        self.backend = backend
+        self.models = list(models)
+        self.engine_args = engine_args or {}
+        self.cache = cache
+        self.prefix_warmup = False
+        self.stream = False
+        self.metrics = RunMetrics()
+        self._engines = dict()
+        self._pending = list()
+        self._flusher = None
+
+    def _engine(self, model):
+        if model not in self._engines:
+            self._engines[model] = ENGINES[self.backend](model, **self.engine_args)
+        return self._engines[model]
+
+    def _prepare(self, messages, kwargs):
+        kwargs["model"] = kwargs.get("model") or self.models[0]
+        if kwargs["model"] not in self.models:
+            raise ValueError(f"No engine runs model {kwargs['model']!r}")
+        request = {"messages": messages, **kwargs}
+        if self.cache is None or not self.cache.accepts(request):
+            return None, None
+        key = request_key({**request, "backend": self.backend})
+        return key, self.cache.get(key)
+
+    def _generate(self, model, requests):
+        results = self._engine(model).generate(requests)
+        return [completion(model, result) for result in results]
+
+    def _finish(self, key, kwargs, called, dispatched, response=None, error=None):
+        self.metrics.add_request(
+            kwargs["model"],
+            self.backend,
+            called,
+            dispatched,
+            0,
+            response=response,
+            error=error,
+        )
+        if key is not None and response is not None:
+            self.cache.put(key, response)
+
+    def chat(self, messages, stop_when=None, **kwargs):
+        called = time.perf_counter()
+        key, cached = self._prepare(messages, kwargs)
+        if cached is not None:
+            self.metrics.add_cache_hit()
+            return cached
+        dispatched = time.perf_counter()
+        try:
+            [response] = self._generate(kwargs["model"], [(messages, kwargs)])
+        except Exception as e:
+            self._finish(key, kwargs, called, dispatched, error=e)
+            raise
+        self._finish(key, kwargs, called, dispatched, response=response)
+        return response
+
+    async def achat(self, messages, stop_when=None, **kwargs):
+        called = time.perf_counter()
+        key, cached = self._prepare(messages, kwargs)
+        if cached is not None:
+            self.metrics.add_cache_hit()
+            return cached
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((messages, kwargs, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        response, error, dispatched = await future
+        self._finish(key, kwargs, called, dispatched, response, error)
+        if error is not None:
+            raise error
+        return response
+
+    async def _flush(self):
+        # Yield until no more callers are ready, so they share the batch.
+        size = -1
+        while size != len(self._pending):
+            size = len(self._pending)
+            await asyncio.sleep(0)
+        while self._pending:
+            batch, self._pending = self._pending, list()
+            batch.sort(key=lambda request: request[1]["model"])
+            for model, group in groupby(batch, key=lambda request: request[1]["model"]):
+                group = list(group)
+                dispatched = time.perf_counter()
+                try:
+                    # In a thread, so requests arriving meanwhile queue up
+                    # for the next batch.
+                    responses = await asyncio.to_thread(
+                        self._generate,
+                        model,
+                        [(messages, kwargs) for messages, kwargs, _ in group],
+                    )
+                except Exception as e:
+                    for *_, future in group:
+                        future.set_result((None, e, dispatched))
+                    continue
+                for (*_, future), response in zip(group, responses):
+                    future.set_result((response, None, dispatched))
+
+    def report(self, output_path=None):
+        print("Token usage: ", self.metrics.usage())
+        if output_path is not None:
+            self.metrics.write(output_path)
+        if self.cache is not None:
+            print("Response cache: ", self.cache.stats())
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    async def aclose(self):
+        pass
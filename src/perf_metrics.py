@@ -0,0 +1,255 @@
+import json
+import math
+import os
+import time
+from collections import Counter, defaultdict
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (q in [0, 100]); None if empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[rank]
+
+
+def distribution(values):
+    values = [value for value in values if value is not None]
+    return {
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def report_path(output_path, suffix=".perf.json"):
+    root, _ = os.path.splitext(output_path)
+    return root + suffix
+
+
+class StreamAccumulator:
+    """Rebuilds a `ChatCompletion` from streamed chunks and times the first token.
+
+    Content is gathered per choice index so `n > 1` streams work too. The
+    usage block arrives in the final chunk when the request sets
+    `stream_options={"include_usage": True}`. A stream closed early
+    (`stopped`) has no usage block; `deltas` counts the content deltas seen,
+    one per generated token on vLLM. Choices still running when it was
+    closed are marked `stopped_early` in the completion.
+    """
+
+    def __init__(self, dispatched):
+        self.dispatched = dispatched
+        self.ttft = None
+        self.stopped = False
+        self.deltas = 0
+        self.id = None
+        self.model = None
+        self.created = None
+        self.usage = None
+        self.content = defaultdict(list)
+        self.finish_reason = dict()
+
+    def add(self, chunk):
+        self.id = self.id or chunk.id
+        self.model = self.model or chunk.model
+        self.created = self.created or chunk.created
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        for choice in chunk.choices:
+            if choice.delta.content:
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.dispatched
+                self.content[choice.index].append(choice.delta.content)
+                self.deltas += 1
+            if choice.finish_reason is not None:
+                self.finish_reason[choice.index] = choice.finish_reason
+
+    def satisfied(self, stop_when, n=1):
+        """Whether each of the `n` choices has finished or satisfies `stop_when`."""
+        return all(
+            index in self.finish_reason or stop_when("".join(self.content[index]))
+            for index in range(n)
+        )
+
+    def completion(self):
+        from openai.types.chat import ChatCompletion
+
+        indices = sorted(set(self.content) | set(self.finish_reason)) or [0]
+        return ChatCompletion.model_validate(
+            {
+                "id": self.id or "",
+                "object": "chat.completion",
+                "created": self.created or 0,
+                "model": self.model or "",
+                "choices": [
+                    {
+                        "index": index,
+                        "message": {
+                            "role": "assistant",
+                            "content": "".join(self.content[index]),
+                        },
+                        "finish_reason": self.finish_reason.get(index, "stop"),
+                        # Not an API field: marks content cut off by closing
+                        # the stream, which callers may need to complete.
+                        "stopped_early": self.stopped
+                        and index not in self.finish_reason,
+                    }
+                    for index in indices
+                ],
+                "usage": self.usage.model_dump() if self.usage else None,
+            }
+        )
+
+
+class RunMetrics:
+    """Per-request timing, token and failure records for one run.
+
+    Times are in seconds. `queue_time` runs from the client call to the
+    dispatch of the final attempt, so it includes rate limiting and retry
+    backoff. `ttft` is only known for streamed requests (`--stream`).
+    Streams closed once the caller had what it needed are counted as
+    `stopped_early`; their completion tokens are the streamed deltas.
+    Failures are recorded by exception type, with `stage` telling request
+    errors apart from responses that could not be parsed.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = list()
+        self.cache_hits = 0
+        self.skipped = 0
+
+    def add_request(
+        self,
+        model,
+        endpoint,
+        called,
+        dispatched,
+        retries,
+        response=None,
+        error=None,
+        stream=None,
+    ):
+        """Record one request; `stream` is its `StreamAccumulator`, if streamed."""
+        finished = time.perf_counter()
+        record = {
+            "model": model,
+            "endpoint": endpoint,
+            "queue_time": dispatched - called,
+            "ttft": None,
+            "latency": finished - dispatched,
+            "total_time": finished - called,
+            "retries": retries,
+            "prompt_tokens": None,
+            "cached_tokens": None,
+            "completion_tokens": None,
+            "error": None,
+            "stage": "request",
+        }
+        if stream is not None:
+            record["ttft"] = stream.ttft
+            record["stopped_early"] = stream.stopped
+        usage = response.usage if response is not None else None
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            record["prompt_tokens"] = usage.prompt_tokens
+            record["completion_tokens"] = usage.completion_tokens
+            record["cached_tokens"] = details.cached_tokens if details else None
+        elif stream is not None and stream.stopped:
+            record["completion_tokens"] = stream.deltas
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+            record["error_type"] = type(error).__name__
+        self.records.append(record)
+
+    def add_cache_hit(self):
+        self.cache_hits += 1
+
+    def add_skipped(self):
+        """Count an item answered locally without a request."""
+        self.skipped += 1
+
+    def add_parse_failure(self, error, model=None):
+        self.records.append(
+            {
+                "model": model,
+                "error": f"{type(error).__name__}: {error}",
+                "error_type": type(error).__name__,
+                "stage": "parse",
+            }
+        )
+
+    def usage(self):
+        requests = [r for r in self.records if r["stage"] == "request"]
+        prompt_tokens = sum(r["prompt_tokens"] or 0 for r in requests)
+        cached_tokens = sum(r["cached_tokens"] or 0 for r in requests)
+        return {
+            "requests": len(requests),
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "cached_prompt_ratio": cached_tokens / max(1, prompt_tokens),
+            "completion_tokens": sum(r["completion_tokens"] or 0 for r in requests),
+        }
+
+    def _summarize(self, records, wall_time):
+        requests = [r for r in records if r["stage"] == "request"]
+        succeeded = [r for r in requests if r["error"] is None]
+        failures = [r for r in records if r["error"] is not None]
+        completion_tokens = sum(r["completion_tokens"] or 0 for r in succeeded)
+        prompt_tokens = sum(r["prompt_tokens"] or 0 for r in succeeded)
+        return {
+            "requests": len(requests),
+            "succeeded": len(succeeded),
+            "retries": sum(r["retries"] for r in requests),
+            "error_rate": len(failures) / max(1, len(requests)),
+            "errors_by_type": dict(
+                Counter(f"{r['stage']}:{r['error_type']}" for r in failures)
+            ),
+            "latency": distribution([r["latency"] for r in succeeded]),
+            "ttft": distribution([r["ttft"] for r in succeeded]),
+            "queue_time": distribution([r["queue_time"] for r in requests]),
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": sum(r["cached_tokens"] or 0 for r in succeeded),
+            "completion_tokens": completion_tokens,
+            "stopped_early": sum(bool(r.get("stopped_early")) for r in succeeded),
+            "prompt_tokens_per_sec": prompt_tokens / wall_time,
+            "completion_tokens_per_sec": completion_tokens / wall_time,
+        }
+
+    def summary(self):
+        wall_time = max(time.perf_counter() - self.started, 1e-9)
+        summary = {
+            "wall_time": wall_time,
+            "cache_hits": self.cache_hits,
+            "skipped": self.skipped,
+        }
+        summary.update(self._summarize(self.records, wall_time))
+        models = {r["model"] for r in self.records if r.get("model")}
+        if len(models) > 1:
+            summary["by_model"] = {
+                model: self._summarize(
+                    [r for r in self.records if r.get("model") == model], wall_time
+                )
+                for model in sorted(models)
+            }
+        return summary
+
+    def write(self, output_path):
+        """Write the summary and per-request records next to `output_path`.
+
+        Nothing is written if no request was made, so a resumed run with
+        nothing left to do keeps the report of the run before it.
+        """
+        if not any(r["stage"] == "request" for r in self.records):
+            return
+        with open(report_path(output_path), "w", encoding="utf-8") as fp:
+            json.dump(self.summary(), fp, indent=4, ensure_ascii=False)
+        with open(
+            report_path(output_path, ".requests.jsonl"), "w", encoding="utf-8"
+        ) as fp:
+            for record in self.records:
+                fp.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import json
+from collections import defaultdict
+
+import construe_component_identification
+import purnopama_component_identification
+from comparator_filter import add_prefilter_args
+from dedup import Deduplicator, add_dedup_args, count_jobs
+from few_shot import add_few_shot_args, few_shot_from_args
+from guided_decoding import add_guided_args
+from llm_client import (
+    add_client_args,
+    client_from_args,
+    dispatch_from_args,
+    run_bounded,
+)
+from postprocess import add_postprocess_args, post_processor_from_args
+from record_io import ModelSinks, iter_records, iter_tsv, model_tag
+from self_consistency import add_sampling_args
+from text_normalization import normalize_sentence
+from upma_classification import add_early_stop_args, classify_sentence_async
+
+
+COMPONENT_TASKS = {
+    "purnopama": purnopama_component_identification.TASK,
+    "construe": construe_component_identification.TASK,
+}
+
+
+def load_gold(paths):
+    # Annotation subsets end with a summary record that has no sentence.
+    gold = list()
+    for path in paths or []:
+        gold.extend(item for item in iter_records(path) if "sentence" in item)
+    return gold
+
+
+async def run_stages(
+    llm,
+    jobs,
+    component_task,
+    max_in_flight,
+    on_result,
+    guided=False,
+    prefilter_mode="off",
+    samples=1,
+    few_shot=None,
+    post=None,
+    order="reason-first",
+    stop_at_label=False,
+    total=None,
+):
+    """Classify each sentence and, for pūrṇopamā, identify its components.
+
+    `jobs` yields `(model, sentence)` pairs. Both stages run inside the same
+    worker, so stage-2 requests for early sentences overlap with stage-1
+    requests for later ones instead of waiting for the whole classification
+    pass to finish. Parsing runs through `post`, in its process pool if it
+    has one, so it does not hold up the event loop.
+    """
+
+    async def process(job):
+        model, sentence = job
+        classified = await classify_sentence_async(
+            llm,
+            sentence,
+            model=model,
+            guided=guided,
+            prefilter_mode=prefilter_mode,
+            samples=samples,
+            post=post,
+            order=order,
+            stop_at_label=stop_at_label,
+        )
+        if classified is None or classified["label"] != "pūrṇopamā":
+            return classified, None
+        components = await component_task.identify_async(
+            llm,
+            classified,
+            model=model,
+            guided=guided,
+            samples=samples,
+            few_shot=few_shot,
+            post=post,
+        )
+        return classified, components
+
+    try:
+        await run_bounded(
+            jobs,
+            process,
+            max_in_flight,
+            on_result,
+            total=total,
+            warmup=llm.prefix_warmup,
+        )
+    finally:
+        await llm.aclose()
+
+
+def evaluate(classified, components, gold_classification, gold_components):
+    results = dict()
+
+    if gold_classification:
+        # Eval code is only needed here, so keep it out of inference-only runs.
+        from upma_classification_eval import compute_metrics
+
+        gold = {
+            normalize_sentence(item["sentence"]): item for item in gold_classification
+        }
+        data = list()
+        for item in classified:
+            gold_item = gold.get(normalize_sentence(item["sentence"]))
+            if gold_item is not None:
+                data.append({**item, "human_label": gold_item["human_label"]})
+        if data:
+            results["classification"] = compute_metrics(data)
+            # The reasoning was just generated and nobody has judged it; the
+            # records only carry the placeholder is_reasoning_correct.
+            del results["classification"]["per_corr_reasoning"]
+        else:
+            print("No classified sentences found in the gold classification data.")
+
+    if gold_components:
+        from purnopama_component_identification_eval import compute_metrics
+
+        gold = {
+            normalize_sentence(item["sentence"])
+            for item in gold_components
+            if item.get("human_label") == "pūrṇopamā"
+        }
+        data = [
+            item for item in components if normalize_sentence(item["sentence"]) in gold
+        ]
+        if data:
+            results["components"] = compute_metrics(gold_components, data)
+        else:
+            print("No identified sentences found in the gold component data.")
+
+    return results
+
+
+def main(args):
+    gold_classification = load_gold(args.gold_classification)
+    gold_components = load_gold(args.gold_components)
+    evaluating = bool(gold_classification or gold_components)
+
+    llm = client_from_args(args)
+    component_task = COMPONENT_TASKS[args.component_mode]
+    few_shot = few_shot_from_args(args, component_task.few_shot_requires)
+    post = post_processor_from_args(args)
+    models = llm.models if len(llm.models) > 1 else [None]
+
+    classification_sink = None
+    if args.classification_output:
+        classification_sink = ModelSinks(args.classification_output, llm.models)
+    components_sink = None
+    if args.components_output:
+        components_sink = ModelSinks(args.components_output, llm.models)
+
+    classified = defaultdict(list)
+    components = defaultdict(list)
+
+    def on_result(idx, result):
+        classified_item, components_item = result
+        if classification_sink is not None:
+            classification_sink.add(idx, classified_item)
+        if components_sink is not None:
+            components_sink.add(idx, components_item)
+        if evaluating:
+            if classified_item is not None:
+                classified[classified_item.get("model")].append(classified_item)
+            if components_item is not None:
+                components[components_item.get("model")].append(components_item)
+
+    def read_jobs():
+        return (
+            (model, sentence)
+            for sentence in iter_tsv(args.input_file_path)
+            for model in models
+        )
+
+    # A counting pass over the input, so progress shows the job count.
+    total = count_jobs(read_jobs(), args.dedup)
+    jobs = read_jobs()
+    dedup = None
+    if args.dedup:
+        dedup = Deduplicator(on_result)
+        jobs, on_result = dedup.jobs(jobs), dedup.add
+
+    jobs, max_in_flight, _ = dispatch_from_args(args, jobs)
+    try:
+        asyncio.run(
+            run_stages(
+                llm,
+                jobs,
+                component_task,
+                max_in_flight,
+                on_result,
+                args.guided,
+                args.prefilter,
+                args.samples,
+                few_shot,
+                post,
+                args.output_order,
+                args.stop_at_label,
+                total,
+            )
+        )
+    finally:
+        llm.report(args.results or args.classification_output or args.components_output)
+        llm.close()
+        post.close()
+        for sink in (classification_sink, components_sink):
+            if sink is not None:
+                sink.close()
+    if dedup is not None:
+        dedup.report()
+
+    if not evaluating:
+        return
+
+    if models == [None]:
+        results = evaluate(
+            classified[None], components[None], gold_classification, gold_components
+        )
+    else:
+        results = {
+            model_tag(model): evaluate(
+                classified[model],
+                components[model],
+                gold_classification,
+                gold_components,
+            )
+            for model in models
+        }
+    print(json.dumps(results, indent=4, ensure_ascii=False))
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=4, ensure_ascii=False)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run classification, component identification and evaluation "
+        "in one process."
+    )
+    parser.add_argument(
+        "-i", "--input-file-path", type=str, required=True, help="Raw sentence TSV."
+    )
+    parser.add_argument(
+        "-m",
+        "--component-mode",
+        choices=sorted(COMPONENT_TASKS),
+        default="purnopama",
+        help="Prompt used for component identification.",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Maximum number of sentences in flight across both stages.",
+    )
+    parser.add_argument(
+        "--classification-output",
+        type=str,
+        default=None,
+        help="Optional path for the stage-1 classification records.",
+    )
+    parser.add_argument(
+        "--components-output",
+        type=str,
+        default=None,
+        help="Optional path for the stage-2 component records.",
+    )
+    parser.add_argument(
+        "--gold-classification",
+        type=str,
+        nargs="*",
+        help="Annotated classification files to evaluate stage 1 against.",
+    )
+    parser.add_argument(
+        "--gold-components",
+        type=str,
+        nargs="*",
+        help="Annotated component files to evaluate stage 2 against.",
+    )
+    parser.add_argument(
+        "-r", "--results", type=str, default=None, help="Path for the metrics JSON."
+    )
+    add_dedup_args(parser)
+    add_client_args(parser)
+    add_guided_args(parser)
+    add_prefilter_args(parser)
+    add_early_stop_args(parser)
+    add_sampling_args(parser)
+    add_postprocess_args(parser)
+    add_few_shot_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import json
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from self_consistency import parse_choices, vote_components
+from text_normalization import fold_iast, to_iast
+
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# Single quotes next to JSON punctuation; an avagraha (svapne'pi) is left alone.
+_SINGLE_QUOTE = re.compile(r"(?<=[{,:\[])\s*'|'(?=\s*[:,}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"'})
+# Quotes and dandas models wrap component values in.
+_EDGE_PUNCTUATION = "\"'‘’“”.,;:।॥| "
+_WHITESPACE = re.compile(r"\s+")
+
+# Fields checked against the sentence; a construe reorders it, so it is not.
+VALIDATED_KEYS = ["upameya", "upamāna", "sādhāraṇadharma", "upamādyotaka"]
+# Values that stand for a missing component.
+ABSENT = {"", "none", "null", "n/a", "-"}
+# Shortest folded stem compared after trimming sandhi letters, so short
+# values do not match anywhere.
+MIN_STEM = 3
+
+
+def _close(text):
+    if text.count('"') % 2:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    return text + "}" * (text.count("{") - text.count("}"))
+
+
+# Applied cumulatively until the text parses.
+_REPAIRS = [
+    lambda text: text.translate(_SMART_QUOTES),
+    lambda text: _TRAILING_COMMA.sub(r"\1", text),
+    lambda text: _SINGLE_QUOTE.sub('"', text),
+    _close,
+]
+
+
+def repair_json(text):
+    """Parse the first JSON object in near-JSON model output.
+
+    Tolerates code fences, text around the object, smart or single quotes,
+    trailing commas and output truncated before the closing quote or brace.
+    """
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        raise ValueError(f"No JSON object in {text!r}")
+    text = text[start:]
+    decoder = json.JSONDecoder()
+    error = None
+    for repair in [lambda text: text] + _REPAIRS:
+        text = repair(text)
+        try:
+            return decoder.raw_decode(text)[0]
+        except ValueError as e:
+            error = error or e
+    raise error
+
+
+def normalize_component(value):
+    """IAST spelling of a component value without wrapping quotes or dandas."""
+    if not isinstance(value, str):
+        return value
+    value = to_iast(value).strip(_EDGE_PUNCTUATION)
+    return _WHITESPACE.sub(" ", value)
+
+
+def _variants(folded):
+    # Word-final letters change under sandhi (rāmaḥ -> rāmo, -au -> -āv) and
+    # an initial vowel may merge with the word before (śata + upama -> śatopama).
+    for head in (0, 1):
+        for tail in (0, 1, 2):
+            stem = folded[head : len(folded) - tail]
+            if len(stem) >= MIN_STEM:
+                yield stem
+
+
+def component_status(sentence, value):
+    """Whether `value` occurs in `sentence`.
+
+    "exact" for a substring, "sandhi" for a match up to diacritics, spacing
+    and sandhi at its edges, "missing" otherwise.
+    """
+    if unicodedata.normalize("NFC", value).lower() in (
+        unicodedata.normalize("NFC", sentence).lower()
+    ):
+        return "exact"
+    text = fold_iast(sentence).replace(" ", "")
+    folded = fold_iast(value).replace(" ", "")
+    if folded and any(stem in text for stem in _variants(folded)):
+        return "sandhi"
+    return "missing"
+
+
+def validate_components(sentence, components):
+    """Status of every component that has a value; see `component_status`."""
+    return {
+        key: component_status(sentence, components[key])
+        for key in VALIDATED_KEYS
+        if isinstance(components.get(key), str)
+        and components[key].strip().lower() not in ABSENT
+    }
+
+
+def finish_components(item, contents, parse, model=None, samples=1, clean=False):
+    """Build the component record for `item` from the completions' contents.
+
+    `parse` takes a content and a `repair` flag. With `clean`, near-JSON is
+    repaired, values are normalized to IAST and each record gets a
+    `validation` map against its sentence.
+    """
+    item = dict(item)
+    parse = functools.partial(parse, repair=clean)
+    if samples > 1:
+        components, item["agreement"] = vote_components(parse_choices(contents, parse))
+    else:
+        components = parse(contents[0])
+    if clean:
+        components = {key: normalize_component(v) for key, v in components.items()}
+    item["components"] = components
+    if clean:
+        item["validation"] = validate_components(item["sentence"], components)
+    if model is not None:
+        item["model"] = model
+    return item
+
+
+def report_failure(llm, sentence, model, error, response):
+    print(f"Exception for sentence: {sentence}: {error!r}")
+    print(f"Response: {response}")
+    if response:
+        llm.metrics.add_parse_failure(error, model)
+
+
+class PostProcessor:
+    """Runs response post-processing, in a process pool when `workers` > 0.
+
+    The functions it runs must be picklable (module-level) and pure, as
+    they execute in another process.
+    """
+
+    def __init__(self, workers=0, clean=False):
+        self.clean = clean
+        self.pool = ProcessPoolExecutor(workers) if workers > 0 else None
+
+    async def run(self, fn, *args):
+        if self.pool is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def post_processor_from_args(args):
+    return PostProcessor(args.postprocess_workers, clean=args.postprocess)
+
+
+def add_postprocess_args(parser):
+    group = parser.add_argument_group("Post-processing")
+    group.add_argument(
+        "--postprocess",
+        action="store_true",
+        help="Repair near-JSON, normalize component values to IAST and record "
+        "whether each occurs in the sentence (exact, sandhi or missing).",
+    )
+    group.add_argument(
+        "--postprocess-workers",
+        type=int,
+        default=0,
+        help="Processes that parse and validate responses in async mode, "
+        "outside the request loop (0 runs it on the loop).",
+    )
@@ -1,14 +1,8 @@
-import os
-import argparse
-from openai import OpenAI
-from tqdm import tqdm
 import json
-import re
-import pandas as pd
 
+from component_identification import ComponentTask, build_parser
+from postprocess import repair_json
 
-client = OpenAI(base_url="http://localhost:8000/v1", api_key="token-123")
-MODEL_NAME = "/home/himanshu.dutta/hf_models/llama-3.1-8b-instruct/"
 
 SYSTEM_PROMPT = """You are a highly knowledgeable language model specializing in classical Sanskrit poetics.You will be given a prose/poetry excerpt in Sanskrit (Romanized) which has presence of the figure of speech called Upamā alaṅkāra. Your task is to identify the essential elements of Upamā alaṅkāra: Upameya, Upamāna, Sādhāraṇadharma, and Upamādyotaka. Upamā alaṅkāra and its elements are described below.
 
@@ -69,50 +63,25 @@ Output:
 """
 
 
-def main(args):
-    with open(args.input_file_path, "r", encoding="utf-8") as fp:
-        data = json.load(fp)
-    outputs = list()
-    for item in tqdm(data):
-        label = item["label"]
-        if label != "pūrṇopamā":
-            continue
-        sentence = item["sentence"]
-        response = ""
-        user_prompt = USER_PROMPT_TEMPLATE.format(sentence=sentence)
-        try:
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {
-                        "role": "user",
-                        "content": user_prompt,
-                    },
-                ],
-                max_tokens=1024,
-            )
-            response = response.choices[0].message.content.strip().lower()
-            # response = response.replace("\n", " ")
-            response = json.loads(response)
-
-            item["components"] = response
-            outputs.append(item)
-
-        except Exception as e:
-            print(f"Exception for sentence: {sentence}")
-            print(f"Response: {response}")
-    print("Number of successful sentences: ", len(outputs))
-    with open(args.output_file_path, "w", encoding="utf-8") as fp:
-        json.dump(outputs, fp, indent=4, ensure_ascii=False)
+def render_example(number, example):
+    output = json.dumps(example["components"], ensure_ascii=False)
+    return f'Example {number}:\nInput: "{example["sentence"]}"\nOutput: {output}'
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input-file-path", type=str, required=True)
-    parser.add_argument("-o", "--output-file-path", type=str, required=True)
-    parser.add_argument("-b", "--batch-size", type=int, default=8)
+def parse_content(content, repair=False):
+    content = content.strip().lower()
+    return repair_json(content) if repair else json.loads(content)
+
 
-    args = parser.parse_args()
+TASK = ComponentTask(
+    SYSTEM_PROMPT,
+    USER_PROMPT_TEMPLATE,
+    render_example,
+    parse_content,
+    guide="components",
+)
+main = TASK.main
 
-    main(args)
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -1,85 +1,445 @@
 import json
 import argparse
-from collections import defaultdict
+import functools
+import math
+from collections import Counter
 
+import numpy as np
 
-def compare_components(a_components, b_components):
-    matches = {
-        key: a_components.get(key) == b_components.get(key) for key in b_components
+from incremental_eval import EvalState, report_diff
+from record_io import EVAL_COLUMNS, iter_records, record_hash, signature
+from text_normalization import fold_iast, normalize_sentence
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def token_f1(a, b):
+    a_tokens, b_tokens = Counter(a.split()), Counter(b.split())
+    overlap = sum((a_tokens & b_tokens).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(a_tokens.values())
+    recall = overlap / sum(b_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def fuzzy_scores(predicted, gold):
+    """(folded match, token F1, character similarity) of two component strings.
+
+    All three compare the IAST-folded forms; the character similarity is one
+    minus the edit distance over the length of the longer string.
+    """
+    if predicted is None or gold is None:
+        score = float(predicted is gold)
+        return score, score, score
+    predicted, gold = fold_iast(str(predicted)), fold_iast(str(gold))
+    longest = max(len(predicted), len(gold), 1)
+    return (
+        float(predicted == gold),
+        token_f1(predicted, gold),
+        1 - edit_distance(predicted, gold) / longest,
+    )
+
+
+GOLD_COLUMNS = EVAL_COLUMNS["gold_components"]
+PREDICTION_COLUMNS = EVAL_COLUMNS["components"]
+
+
+def gold_components(item):
+    # A few annotation records spell the field "components_corr".
+    return item.get("component_corr", item.get("components_corr", {}))
+
+
+class GoldIndex:
+    """Gold component annotations indexed by normalized sentence.
+
+    Built once per gold file and reused for every prediction file. Component
+    strings are interned into integer codes (None is -1), so comparing a
+    whole prediction file is a single array comparison per component.
+    Only the keys a prediction contains are scored for it, and a later gold
+    record for the same sentence replaces an earlier one. Fuzzy scores are
+    cached per (predicted, gold) code pair, so each distinct pair is scored
+    once however many files it appears in.
+    """
+
+    def __init__(self, a_data):
+        items = dict()
+        for item in a_data:
+            if "sentence" in item:
+                items[normalize_sentence(item["sentence"])] = item
+        items = {
+            sentence: item
+            for sentence, item in items.items()
+            if item.get("human_label") == "pūrṇopamā"
+        }
+        self.rows = {sentence: row for row, sentence in enumerate(items)}
+        self.components = [gold_components(item) for item in items.values()]
+        self.vocab = dict()
+        self.strings = list()
+        self.columns = dict()
+        self.pair_scores = dict()
+
+    def code(self, value):
+        if value is None:
+            return -1
+        code = self.vocab.get(value)
+        if code is None:
+            code = self.vocab[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def string(self, code):
+        return None if code < 0 else self.strings[code]
+
+    def column(self, key):
+        if key not in self.columns:
+            self.columns[key] = np.array(
+                [self.code(components.get(key)) for components in self.components],
+                dtype=np.int64,
+            )
+        return self.columns[key]
+
+    def match_matrix(self, b_data):
+        """Return (keys, predicted, gold, present) for predictions in the gold set.
+
+        `predicted` and `gold` hold component codes and `present` marks the
+        keys each prediction contains, all of shape (sentences, keys).
+        """
+        rows = list()
+        predictions = list()
+        for b_item in b_data:
+            row = self.rows.get(normalize_sentence(b_item["sentence"]))
+            if row is not None:
+                rows.append(row)
+                predictions.append(b_item.get("components", {}))
+
+        keys = list(dict.fromkeys(key for item in predictions for key in item))
+        present = np.array(
+            [[key in item for key in keys] for item in predictions], dtype=bool
+        ).reshape(len(predictions), len(keys))
+        predicted = np.array(
+            [[self.code(item.get(key)) for key in keys] for item in predictions],
+            dtype=np.int64,
+        ).reshape(len(predictions), len(keys))
+        if keys:
+            gold = np.stack([self.column(key) for key in keys], axis=1)[rows]
+        else:
+            gold = np.zeros((len(rows), 0), dtype=np.int64)
+        return keys, predicted, gold, present
+
+    def fuzzy_matrix(self, predicted, gold):
+        """Fuzzy scores for every cell, shape (sentences, keys, 3)."""
+        pairs = np.stack([predicted.ravel(), gold.ravel()], axis=1)
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        scores = list()
+        for pair in map(tuple, unique.tolist()):
+            if pair not in self.pair_scores:
+                self.pair_scores[pair] = fuzzy_scores(*map(self.string, pair))
+            scores.append(self.pair_scores[pair])
+        scores = np.array(scores, dtype=float).reshape(len(unique), 3)
+        return scores[inverse.ravel()].reshape(*predicted.shape, 3)
+
+    def vectors(self, b_data, fuzzy=False):
+        """Per-prediction {key: cell} for predictions in the gold set.
+
+        A cell is [matched] or, with `fuzzy`, [matched, folded match, token
+        F1, character similarity], for each key the prediction contains.
+        """
+        b_data = [
+            b_item
+            for b_item in b_data
+            if normalize_sentence(b_item["sentence"]) in self.rows
+        ]
+        keys, predicted, gold, present = self.match_matrix(b_data)
+        columns = {key: j for j, key in enumerate(keys)}
+        matched = (predicted == gold) & present
+        if fuzzy and keys:
+            scores = self.fuzzy_matrix(predicted, gold)
+        vectors = list()
+        for i, b_item in enumerate(b_data):
+            vector = dict()
+            for key in b_item.get("components", {}):
+                j = columns[key]
+                vector[key] = [int(matched[i, j])]
+                if fuzzy:
+                    vector[key] += [
+                        int(scores[i, j, 0] == 1),
+                        float(scores[i, j, 1]),
+                        float(scores[i, j, 2]),
+                    ]
+            vectors.append(vector)
+        return vectors
+
+    def evaluate(self, b_data, fuzzy=False):
+        keys, predicted, gold, present = self.match_matrix(b_data)
+        matched = (predicted == gold) & present
+        total = len(matched)
+        exact = matched.sum(axis=1) == present.sum(axis=1)
+        component_counts = matched.sum(axis=0)
+
+        results = {
+            "total_sentences": total,
+            "exact_match_count": int(exact.sum()),
+            "component_matches": {},
+            "overall_match_count": int(exact.sum()),
+        }
+        results["exact_match_percentage"] = (
+            results["exact_match_count"] / max(1, total) * 100
+        )
+        results["overall_match_percentage"] = (
+            results["overall_match_count"] / max(1, total) * 100
+        )
+        for key, count in zip(keys, component_counts):
+            results["component_matches"][key] = {
+                "count": int(count),
+                "percentage": int(count) / max(1, total) * 100,
+            }
+        if fuzzy:
+            results["fuzzy"] = fuzzy_summary(
+                keys, self.fuzzy_matrix(predicted, gold), present
+            )
+        return results
+
+
+def mean(values):
+    # fsum is exact, so the mean does not depend on the order of the values
+    # and incremental runs give the same results as full ones.
+    values = list(values)
+    return math.fsum(values) / len(values) if values else 0.0
+
+
+def fuzzy_summary(keys, scores, present):
+    """Aggregate fuzzy scores over the components each prediction contains."""
+    total = len(present)
+    folded = (scores[..., 0] == 1) | ~present
+    summary = {
+        "folded_match_count": int(folded.all(axis=1).sum()),
+        "token_f1": mean(scores[..., 1][present].tolist()),
+        "char_similarity": mean(scores[..., 2][present].tolist()),
+        "component_matches": {},
     }
-    exact_matches = sum(matches.values())
-    total_keys = len(matches)
-    return matches, exact_matches, total_keys
+    summary["folded_match_percentage"] = (
+        summary["folded_match_count"] / max(1, total) * 100
+    )
+    for i, key in enumerate(keys):
+        mask = present[:, i]
+        count = int((scores[:, i, 0] == 1)[mask].sum())
+        summary["component_matches"][key] = {
+            "folded_count": count,
+            "folded_percentage": count / max(1, total) * 100,
+            "token_f1": mean(scores[mask, i, 1].tolist()),
+            "char_similarity": mean(scores[mask, i, 2].tolist()),
+        }
+    return summary
+
 
+def empty_totals():
+    # components: key -> [present, matched, folded]. Fuzzy scores are floats,
+    # so they are summed from the stored vectors rather than kept running.
+    return {"total": 0, "exact": 0, "folded": 0, "components": {}}
 
-def calculate_metrics(a_file, b_file, output_file):
-    with open(a_file, "r", encoding="utf-8") as file_a, open(
-        b_file, "r", encoding="utf-8"
-    ) as file_b:
-        a_data = json.load(file_a)
-        b_data = json.load(file_b)
 
-    a_dict = {item["sentence"]: item for item in a_data}
+def accumulate(totals, vector, count=1):
+    """Add `count` sentences with match `vector` to `totals` (negative removes)."""
+    cells = list(vector.values())
+    totals["total"] += count
+    totals["exact"] += count * all(cell[0] for cell in cells)
+    totals["folded"] += count * all(cell[1] for cell in cells if len(cell) > 1)
+    for key, cell in vector.items():
+        component = totals["components"].setdefault(key, [0] * min(len(cell) + 1, 3))
+        component[0] += count
+        for i, value in enumerate(cell[:2], 1):
+            component[i] += count * value
+        if component[0] == 0:
+            del totals["components"][key]
 
+
+def results_from_totals(totals, vectors, fuzzy=False):
+    """The `GoldIndex.evaluate` results from accumulated totals.
+
+    `vectors` are the match vectors of the sentences, in input order.
+    """
+    total = totals["total"]
+    keys = dict.fromkeys(key for vector in vectors for key in vector)
+    components = {key: totals["components"][key] for key in keys}
     results = {
-        "total_sentences": 0,
-        "exact_match_count": 0,
-        "component_matches": defaultdict(int),
-        "overall_match_count": 0,
+        "total_sentences": total,
+        "exact_match_count": totals["exact"],
+        "component_matches": {},
+        "overall_match_count": totals["exact"],
     }
+    results["exact_match_percentage"] = totals["exact"] / max(1, total) * 100
+    results["overall_match_percentage"] = totals["exact"] / max(1, total) * 100
+    for key, (_, count, *_) in components.items():
+        results["component_matches"][key] = {
+            "count": count,
+            "percentage": count / max(1, total) * 100,
+        }
+    if not fuzzy:
+        return results
 
-    for b_item in b_data:
-        sentence = b_item["sentence"]
+    cells = [(key, cell) for vector in vectors for key, cell in vector.items()]
+    summary = {
+        "folded_match_count": totals["folded"],
+        "token_f1": mean(cell[2] for _, cell in cells),
+        "char_similarity": mean(cell[3] for _, cell in cells),
+        "component_matches": {},
+    }
+    summary["folded_match_percentage"] = totals["folded"] / max(1, total) * 100
+    for key, (_, _, folded) in components.items():
+        summary["component_matches"][key] = {
+            "folded_count": folded,
+            "folded_percentage": folded / max(1, total) * 100,
+            "token_f1": mean(cell[2] for k, cell in cells if k == key),
+            "char_similarity": mean(cell[3] for k, cell in cells if k == key),
+        }
+    results["fuzzy"] = summary
+    return results
+
+
+def evaluate_incremental(state, a_file, b_file, load_index, fuzzy=False):
+    """Results for `b_file`, re-scoring only the records not in `state`.
 
-        b_components = b_item.get("components", {})
+    A record is keyed by its sentence, predicted and gold components, so a
+    change to either file re-scores just the sentences it touches.
+    `load_index()` returns the gold `GoldIndex`, and is only called if a
+    record has to be decoded.
+    """
+    key = json.dumps([a_file, b_file])
+    files = [a_file, b_file]
+    options = {"fuzzy": fuzzy}
+    if state.fresh(key, files, options):
+        entry = state.entries[key]
+        report_diff(b_file)
+    else:
+        records = dict()
 
-        if sentence in a_dict:
-            if a_dict[sentence]["human_label"] != "pūrṇopamā":
-                continue
-            a_components = a_dict[sentence].get("component_corr", {})
-            matches, exact_matches, total_keys = compare_components(
-                a_components, b_components
+        def hash_record(b_item):
+            index = load_index()
+            sentence = normalize_sentence(b_item["sentence"])
+            row = index.rows.get(sentence)
+            if row is None:
+                return None
+            h = record_hash(
+                sentence, b_item.get("components", {}), index.components[row]
             )
-            results["total_sentences"] += 1
+            records[h] = b_item
+            return h
 
-            results["exact_match_count"] += exact_matches == total_keys
-            results["overall_match_count"] += all(matches.values())
+        # Line hashes include the gold components, so they only carry over
+        # while the gold file is unchanged.
+        hashes, lines = state.record_hashes(
+            key, b_file, hash_record, PREDICTION_COLUMNS, signature(a_file), options
+        )
+        entry, added, removed = state.update(
+            key,
+            files,
+            [h for h in hashes if h is not None],
+            lambda missing: dict(
+                zip(missing, load_index().vectors([records[h] for h in missing], fuzzy))
+            ),
+            accumulate,
+            empty_totals,
+            options,
+            lines,
+        )
+        report_diff(b_file, added, removed)
+    vectors = [entry["vectors"][h] for h in entry["order"]]
+    return results_from_totals(entry["totals"], vectors, fuzzy)
 
-            for key, matched in matches.items():
-                results["component_matches"][key] += matched
 
-    # Calculate percentages
-    results["exact_match_percentage"] = (
-        results["exact_match_count"] / results["total_sentences"] * 100
-    )
-    results["overall_match_percentage"] = (
-        results["overall_match_count"] / results["total_sentences"] * 100
+def compute_metrics(a_data, b_data):
+    return GoldIndex(a_data).evaluate(b_data)
+
+
+def calculate_metrics(a_file, b_files, output_file, fuzzy=False, state_file=None):
+    """Evaluate one or more prediction files against a single gold file.
+
+    With one prediction file the output has the original flat layout; with
+    several it maps each prediction file to its results. `fuzzy` adds
+    diacritic-insensitive, token-overlap and edit-distance scores.
+    `state_file` keeps per-record scores between runs, so a re-run only
+    scores the records that changed.
+    """
+    if isinstance(b_files, str):
+        b_files = [b_files]
+    load_index = functools.cache(
+        lambda: GoldIndex(iter_records(a_file, columns=GOLD_COLUMNS))
     )
-    for key in results["component_matches"]:
-        results["component_matches"][key] = {
-            "count": results["component_matches"][key],
-            "percentage": results["component_matches"][key]
-            / results["total_sentences"]
-            * 100,
+    if state_file is None:
+        index = load_index()
+        results = {
+            b_file: index.evaluate(
+                iter_records(b_file, columns=PREDICTION_COLUMNS), fuzzy
+            )
+            for b_file in b_files
         }
+    else:
+        state = EvalState(state_file)
+        results = {
+            b_file: evaluate_incremental(state, a_file, b_file, load_index, fuzzy)
+            for b_file in b_files
+        }
+        state.save()
+    if len(b_files) == 1:
+        results = results[b_files[0]]
 
     # Save results to JSON file
     with open(output_file, "w", encoding="utf-8") as output:
         json.dump(results, output, indent=4, ensure_ascii=False)
 
 
-if __name__ == "__main__":
+def main(args):
+    calculate_metrics(
+        args.a_file, args.b_file, args.output_file, args.fuzzy, args.state
+    )
+
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Compare components in JSON files and generate metrics."
     )
     parser.add_argument("-a_file", type=str, help="Path to A.json")
-    parser.add_argument("-b_file", type=str, help="Path to B.json")
+    parser.add_argument(
+        "-b_file",
+        type=str,
+        nargs="+",
+        help="Path to B.json; several files are evaluated against A in one pass",
+    )
     parser.add_argument(
         "-output_file", type=str, help="Path to save the results JSON file"
     )
-
-    args = parser.parse_args()
-
-    calculate_metrics(args.a_file, args.b_file, args.output_file)
+    parser.add_argument(
+        "-fuzzy",
+        action="store_true",
+        help="Also report IAST-insensitive, token F1 and edit-distance scores",
+    )
+    parser.add_argument(
+        "-state",
+        type=str,
+        default=None,
+        help="Keep per-record scores in this file and on later runs re-score "
+        "only the records that changed",
+    )
+    return parser
 
 
+if __name__ == "__main__":
+    main(build_parser().parse_args())
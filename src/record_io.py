@@ -0,0 +1,354 @@
+import csv
+import hashlib
+import json
+import os
+import re
+
+
+_SEPARATOR = re.compile(r"[\s,]*")
+
+COLUMNAR_SUFFIXES = (".parquet", ".arrow", ".feather")
+
+# Schema metadata key listing the columns stored as JSON text.
+JSON_COLUMNS_KEY = b"json_columns"
+
+# Fields each evaluation reads, by kind of input file. Given as `columns`,
+# Parquet/Arrow inputs load nothing else; other formats yield whole records.
+EVAL_COLUMNS = {
+    "classification": ["label", "human_label", "is_reasoning_correct"],
+    "gold_components": ["sentence", "human_label", "component_corr", "components_corr"],
+    "components": ["sentence", "components"],
+}
+
+
+def is_jsonl(path):
+    return path.endswith(".jsonl")
+
+
+def record_hash(*parts):
+    text = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def signature(*paths):
+    """Size and modification time of each file; a changed file changes it."""
+    return [[os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in paths]
+
+
+def iter_tsv(path, column="sentence"):
+    """Yield one column of a tab-separated file with a header row."""
+    with open(path, "r", encoding="utf-8", newline="") as fp:
+        for row in csv.DictReader(fp, delimiter="\t"):
+            yield row[column]
+
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_jsonl_lines(path):
+    """Yield the non-blank lines of a JSONL file as undecoded bytes."""
+    with open(path, "rb") as fp:
+        for line in fp:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading it whole.
+
+    The file is read in chunks and each element is decoded as soon as it is
+    complete, so memory stays bounded by the largest element.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as fp:
+        buffer = fp.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            pos = _SEPARATOR.match(buffer, pos).end()
+            if buffer.startswith("]", pos):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                end = None
+            # A decode that runs into the end of the buffer may be a prefix
+            # of a longer value, so only trust it once more input follows.
+            if end is not None and (end < len(buffer) or eof):
+                yield item
+                pos = end
+                continue
+            if eof:
+                raise ValueError(f"{path} ends inside a JSON array")
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+def is_columnar(path):
+    return path.endswith(COLUMNAR_SUFFIXES)
+
+
+def _import_pyarrow():
+    # pyarrow is optional: only Parquet/Arrow files need it.
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "Parquet/Arrow files need pyarrow: pip install pyarrow"
+        ) from e
+    return pyarrow
+
+
+def records_to_table(records):
+    """Build an Arrow table with one column per record key.
+
+    Nested values (`components`, `component_corr`, ...) have different keys
+    from record to record, so those columns hold JSON text; their names are
+    kept in the schema metadata. A key missing from a record is a null cell.
+    """
+    pa = _import_pyarrow()
+    records = list(records)
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    arrays = dict()
+    json_columns = list()
+    for column in columns:
+        values = [record.get(column) for record in records]
+        nested = any(isinstance(value, (dict, list)) for value in values)
+        if not nested:
+            try:
+                arrays[column] = pa.array(values)
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        json_columns.append(column)
+        arrays[column] = pa.array(
+            [
+                (
+                    json.dumps(record[column], ensure_ascii=False)
+                    if column in record
+                    else None
+                )
+                for record in records
+            ],
+            type=pa.string(),
+        )
+    metadata = {JSON_COLUMNS_KEY: json.dumps(json_columns).encode("utf-8")}
+    return pa.table(arrays, metadata=metadata)
+
+
+def write_columnar(records, path):
+    """Write records as Parquet (zstd) or as an uncompressed, mappable Arrow file."""
+    pa = _import_pyarrow()
+    table = records_to_table(records)
+    if path.endswith(".parquet"):
+        pa.parquet.write_table(table, path, compression="zstd")
+    else:
+        pa.feather.write_feather(table, path, compression="uncompressed")
+
+
+def read_table(path, columns=None):
+    """Memory-map a Parquet/Arrow file, reading only `columns` if given.
+
+    Requested columns the file does not have are ignored.
+    """
+    pa = _import_pyarrow()
+    if path.endswith(".parquet"):
+        names = pa.parquet.read_schema(path).names
+    else:
+        with pa.memory_map(path) as source:
+            names = pa.ipc.open_file(source).schema.names
+    if columns is not None:
+        columns = [column for column in names if column in set(columns)]
+    if path.endswith(".parquet"):
+        return pa.parquet.read_table(path, columns=columns, memory_map=True)
+    return pa.feather.read_table(path, columns=columns, memory_map=True)
+
+
+def iter_columnar(path, columns=None):
+    """Yield the rows of a Parquet/Arrow file as records.
+
+    JSON columns are decoded and null cells are left out, the inverse of
+    `records_to_table`, so records round-trip except for explicit nulls in
+    plain columns.
+    """
+    table = read_table(path, columns)
+    metadata = table.schema.metadata or {}
+    json_columns = set(json.loads(metadata.get(JSON_COLUMNS_KEY, b"[]")))
+    for batch in table.to_batches():
+        for row in batch.to_pylist():
+            yield {
+                key: json.loads(value) if key in json_columns else value
+                for key, value in row.items()
+                if value is not None
+            }
+
+
+def iter_records(path, label=None, label_key="label", columns=None):
+    """Lazily read records from a .tsv, .jsonl, .json (array) or columnar file.
+
+    TSV rows are yielded as `{"sentence": ...}` records. When `label` is
+    given, only records whose `label_key` equals it are yielded. `columns`
+    limits what is read from Parquet/Arrow files; other formats yield whole
+    records.
+    """
+    if path.endswith(".tsv"):
+        records = ({"sentence": sentence} for sentence in iter_tsv(path))
+    elif is_columnar(path):
+        if columns is not None and label is not None:
+            columns = list(columns) + [label_key]
+        records = iter_columnar(path, columns)
+    elif is_jsonl(path):
+        records = iter_jsonl(path)
+    else:
+        records = iter_json_array(path)
+
+    for record in records:
+        if label is None or record.get(label_key) == label:
+            yield record
+
+
+def read_jsonl_records(path):
+    """Read complete records from a JSONL file, dropping a torn last line.
+
+    A run killed mid-write can leave a partial final line; it is truncated
+    away so that appending to the file afterwards keeps it valid.
+    """
+    records = list()
+    with open(path, "r+", encoding="utf-8") as fp:
+        offset = 0
+        for line in iter(fp.readline, ""):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            offset = fp.tell()
+        fp.truncate(offset)
+    return records
+
+
+class OutputSink:
+    """Collects finished records and writes them to the output file.
+
+    For `.jsonl` paths every record is appended and flushed as soon as it is
+    added, so an interrupted run keeps everything finished so far. Parquet
+    and Arrow paths are written with `write_columnar` on `close`. Other
+    paths keep the original behaviour of a single indented JSON array written
+    on `close`, ordered by input index.
+
+    With `resume=True` the records already in the output file are kept and
+    their sentences are exposed as `completed` so callers can skip them.
+    """
+
+    def __init__(self, path, resume=False, key="sentence"):
+        self.path = path
+        self.key = key
+        self.jsonl = is_jsonl(path)
+        self.count = 0
+        self.previous = list()
+        self.pending = dict()
+
+        if resume and os.path.exists(path):
+            if self.jsonl:
+                self.previous = read_jsonl_records(path)
+            elif is_columnar(path):
+                self.previous = list(iter_columnar(path))
+            else:
+                with open(path, "r", encoding="utf-8") as fp:
+                    self.previous = json.load(fp)
+        self.completed = {record[key] for record in self.previous}
+
+        self._fp = None
+        if self.jsonl:
+            self._fp = open(path, "a" if resume else "w", encoding="utf-8")
+            self.previous = list()
+
+    def add(self, idx, record):
+        if record is None:
+            return
+        self.count += 1
+        if self._fp is not None:
+            self._fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._fp.flush()
+        else:
+            self.pending[idx] = record
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            return
+        outputs = self.previous + [self.pending[idx] for idx in sorted(self.pending)]
+        if is_columnar(self.path):
+            write_columnar(outputs, self.path)
+            return
+        with open(self.path, "w", encoding="utf-8") as fp:
+            json.dump(outputs, fp, indent=4, ensure_ascii=False)
+
+
+def model_tag(model):
+    """Short name for a model, e.g. the directory name of a local model path."""
+    return os.path.basename(model.rstrip("/")) or model
+
+
+def model_output_path(path, model):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{model_tag(model)}{ext}"
+
+
+class ModelSinks:
+    """Routes records of a multi-model sweep to one `OutputSink` per model.
+
+    With a single model, records go unchanged to `path` and `models` is
+    `[None]`, so callers keep the default model. With several, records carry
+    a `"model"` field and are written to `model_output_path(path, model)`.
+    """
+
+    def __init__(self, path, models, resume=False):
+        if len(models) > 1:
+            self.sinks = {
+                model: OutputSink(model_output_path(path, model), resume=resume)
+                for model in models
+            }
+        else:
+            self.sinks = {None: OutputSink(path, resume=resume)}
+        self.models = list(self.sinks)
+
+    @property
+    def count(self):
+        return sum(sink.count for sink in self.sinks.values())
+
+    def jobs(self, items, sentence_of=lambda item: item["sentence"]):
+        """Yield `(model, item)` for every pair not already in the outputs."""
+        for item in items:
+            for model, sink in self.sinks.items():
+                if sentence_of(item) not in sink.completed:
+                    yield model, item
+
+    def add(self, idx, record):
+        if record is None:
+            return
+        self.sinks[record.get("model")].add(idx, record)
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+
+def add_output_args(parser):
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep records already in the output file and skip their sentences. "
+        "Use a .jsonl output path to write and flush one record per sentence.",
+    )
+    return parser
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_CACHE_PATH = ".llm_cache.sqlite"
+
+
+def request_key(request):
+    """Content hash of a chat request (model, messages and sampling params)."""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_sampled(request):
+    """Whether a request asks for random samples rather than one fixed answer."""
+    return (request.get("temperature") or 0) > 0 or (request.get("n") or 1) > 1
+
+
+class ResponseCache:
+    """SQLite-backed, content-addressed store of chat completions.
+
+    Entries are keyed by `request_key` of the full request. Each hit refreshes
+    the entry's access time, and once the table grows past `max_entries` the
+    least recently used rows are evicted, a tenth of the table at a time.
+    Access times are kept in memory and written with the next `put`, every
+    `touch_batch` hits or on `close`, so a hit does not commit.
+
+    Sampled requests (temperature above 0 or n above 1) are only cached with
+    `sampled`, since a rerun of them is meant to draw new samples.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_CACHE_PATH,
+        max_entries=100_000,
+        sampled=False,
+        touch_batch=256,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.sampled = sampled
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._touched = dict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)"
+        )
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        self._evict()
+        self._conn.commit()
+
+    def accepts(self, request):
+        return self.sampled or not is_sampled(request)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._write_touched()
+                self._conn.commit()
+        from openai.types.chat import ChatCompletion
+
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key, response):
+        with self._lock:
+            self._write_touched()
+            row = (response.model_dump_json(), time.time(), key)
+            updated = self._conn.execute(
+                "UPDATE responses SET response = ?, last_access = ? WHERE key = ?", row
+            ).rowcount
+            if not updated:
+                self._conn.execute(
+                    "INSERT INTO responses (response, last_access, key) "
+                    "VALUES (?, ?, ?)",
+                    row,
+                )
+                self._count += 1
+            self._evict()
+            self._conn.commit()
+
+    def _write_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        if self._count <= self.max_entries:
+            return
+        # Evict down to 90% so the next evictions are a batch of puts away;
+        # the count is re-read as another process may share the file.
+        keep = self.max_entries - self.max_entries // 10
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY last_access LIMIT "
+            "max(0, (SELECT COUNT(*) FROM responses) - ?))",
+            (keep,),
+        )
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+            self._conn.close()
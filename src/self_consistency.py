@@ -0,0 +1,78 @@
+from collections import Counter
+
+from text_normalization import fold_iast
+
+
+def sampling_options(samples=1):
+    """Extra `chat` arguments asking for `samples` completions in one request.
+
+    The choices share the prompt prefill on the server, so n samples cost one
+    prefill plus n decodes instead of n full requests.
+    """
+    return {"n": samples} if samples > 1 else {}
+
+
+def choice_contents(response):
+    return [choice.message.content for choice in response.choices]
+
+
+def parse_choices(contents, parse):
+    """Apply `parse` to every choice's content, dropping those that fail.
+
+    Raises the first error if no choice parses.
+    """
+    parsed = list()
+    first_error = None
+    for content in contents:
+        try:
+            parsed.append(parse(content))
+        except Exception as e:
+            first_error = first_error or e
+    if not parsed:
+        raise first_error
+    return parsed
+
+
+def vote(values, key=None):
+    """Majority value of `values` and the fraction of votes it received.
+
+    Values are grouped by `key` (identity by default); the winner is the
+    first value seen in the largest group, ties going to the earliest group.
+    """
+    key = key or (lambda value: value)
+    groups = Counter(key(value) for value in values)
+    winner_key, count = groups.most_common(1)[0]
+    winner = next(value for value in values if key(value) == winner_key)
+    return winner, count / len(values)
+
+
+def component_key(value):
+    return None if value is None else fold_iast(str(value))
+
+
+def vote_components(samples):
+    """Vote every component across parsed samples.
+
+    Values are compared IAST-folded, so "rāmaḥ" and "rāma" vote together. A
+    sample without a component votes for its absence; a component most
+    samples leave out is dropped. Returns (components, agreement).
+    """
+    keys = list(dict.fromkeys(key for sample in samples for key in sample))
+    components = dict()
+    agreement = dict()
+    for key in keys:
+        value, agreement[key] = vote(
+            [sample.get(key) for sample in samples], component_key
+        )
+        if value is not None:
+            components[key] = value
+    return components, agreement
+
+
+def add_sampling_args(parser):
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=1,
+        help="Completions per prompt (n) for self-consistency voting.",
+    )
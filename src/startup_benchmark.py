@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from cli import COMMANDS
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Packages only some code paths need. Importing a command's module must not
+# load them unless the command is listed as needing them.
+DEFERRED = ["openai", "tqdm", "numpy", "pyarrow"]
+NEEDS = {
+    "eval-classification": {"numpy"},
+    "eval-components": {"numpy"},
+}
+
+
+def parse_importtime(stderr):
+    """Cumulative import time in microseconds of every module in `-X importtime` output."""
+    times = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def time_import(module):
+    """Import `module` in a fresh interpreter; returns the `-X importtime` table."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(completed.stderr)
+
+
+def measure(command, module, repeat, startup=()):
+    runs = [time_import(module) for _ in range(repeat)]
+    loaded = set(runs[0])
+    deferred = [
+        package
+        for package in DEFERRED
+        if package in loaded and package not in NEEDS.get(command, set())
+    ]
+    heaviest = sorted(
+        (
+            name
+            for name in runs[0]
+            if "." not in name and name != module and name not in startup
+        ),
+        key=runs[0].get,
+        reverse=True,
+    )[:3]
+    return {
+        "command": command,
+        "module": module,
+        "import_ms": statistics.median(run[module] for run in runs) / 1000,
+        "heaviest": {name: runs[0][name] / 1000 for name in heaviest},
+        "eager_deferred": deferred,
+    }
+
+
+def main(args):
+    failed = False
+    results = list()
+    # Modules the interpreter loads before running anything (site, encodings).
+    startup = set(time_import("sys"))
+    for command in args.commands:
+        result = measure(command, COMMANDS[command][0], args.repeat, startup)
+        results.append(result)
+        heaviest = ", ".join(
+            f"{name} {ms:.0f}" for name, ms in result["heaviest"].items()
+        )
+        print(f"{command:>20} {result['import_ms']:7.1f} ms  ({heaviest})")
+        if result["eager_deferred"]:
+            print(f"{'':>20} imports {', '.join(result['eager_deferred'])} eagerly")
+            failed = True
+        if args.max_import_ms is not None and result["import_ms"] > args.max_import_ms:
+            print(f"{'':>20} exceeds {args.max_import_ms} ms")
+            failed = True
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=4)
+    if failed:
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Measure how long each command's module takes to import, and "
+        "fail if one loads a deferred package (openai, numpy, ...) at import."
+    )
+    parser.add_argument(
+        "-c",
+        "--commands",
+        nargs="+",
+        choices=list(COMMANDS),
+        default=list(COMMANDS),
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Imports per module; the median is reported.",
+    )
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="Fail if a module takes longer than this to import.",
+    )
+    parser.add_argument("-o", "--output", type=str, default=None)
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
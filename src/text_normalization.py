@@ -0,0 +1,93 @@
+import functools
+import hashlib
+import re
+import unicodedata
+
+
+# Danda variants and the separators the corpora put around them ("।,", "||").
+# The apostrophe (avagraha, svapne'pi) and colon (used for visarga in some
+# transcriptions) are left alone.
+_PUNCTUATION = re.compile(r"[।॥|,.;!?\"“”]+")
+_WHITESPACE = re.compile(r"\s+")
+# Word-final visarga/anusvara, which sandhi and annotators drop freely.
+_FINAL_NASAL_OR_VISARGA = re.compile(r"[ḥṃ:](?=\s|$)")
+
+
+def normalize_sentence(sentence):
+    """Key used to join records of the same verse across files.
+
+    Applies Unicode NFC, lowercases, drops dandas and other punctuation, and
+    collapses whitespace, so "…vivasvataḥ॥" and "…vivasvataḥ ।।" agree.
+    """
+    sentence = unicodedata.normalize("NFC", sentence).lower()
+    sentence = _PUNCTUATION.sub(" ", sentence)
+    return _WHITESPACE.sub(" ", sentence).strip()
+
+
+@functools.lru_cache(maxsize=4096)
+def fold_iast(text):
+    """Diacritic-insensitive form of an IAST string for fuzzy matching.
+
+    On top of `normalize_sentence`, drops word-final visarga and anusvara and
+    strips combining marks, so "rāmaḥ", "Rāma" and "rama" all fold to "rama".
+    Memoized, as the same component strings recur across prediction files;
+    the cache is bounded because whole sentences are folded too.
+    """
+    text = _FINAL_NASAL_OR_VISARGA.sub("", normalize_sentence(text))
+    return "".join(
+        char
+        for char in unicodedata.normalize("NFD", text)
+        if not unicodedata.combining(char)
+    )
+
+
+# ISO 15919 letters models mix into IAST output (prahr̥tam, bhārgavēna).
+_ISO_TO_IAST = [
+    ("r̥̄", "ṝ"),
+    ("r̥", "ṛ"),
+    ("l̥̄", "ḹ"),
+    ("l̥", "ḷ"),
+    ("ṁ", "ṃ"),
+    ("ē", "e"),
+    ("ō", "o"),
+]
+
+
+def to_iast(text):
+    """NFC-normalize `text` and spell ISO 15919 letters the IAST way."""
+    text = unicodedata.normalize("NFC", text)
+    for iso, iast in _ISO_TO_IAST:
+        text = text.replace(unicodedata.normalize("NFC", iso), iast)
+    return text
+
+
+_DANDA_VARIANTS = [
+    (re.compile(r"\|\||।।|।\s*।"), "॥"),
+    (re.compile(r"\|"), "।"),
+    # Separators after a danda ("।," joining half-verses) and spaces before it.
+    (re.compile(r"\s*([।॥])[\s,;]*"), r"\1 "),
+]
+
+
+def canonical_sentence(sentence):
+    """One spelling of a verse for sending to the model.
+
+    Unlike `normalize_sentence` it keeps case and dandas, but writes them
+    one way: NFC, "|"/"||"/"।।" as "।"/"॥", no separators after a danda and
+    single spaces.
+    """
+    sentence = unicodedata.normalize("NFC", sentence)
+    for pattern, replacement in _DANDA_VARIANTS:
+        sentence = pattern.sub(replacement, sentence)
+    return _WHITESPACE.sub(" ", sentence).strip()
+
+
+def verse_key(sentence):
+    """Hash shared by spellings of the same verse.
+
+    The IAST-folded text without spaces, so variants in punctuation,
+    diacritics, final visarga/anusvara and word splits at sandhi
+    (himavān iva / himavāniva) agree.
+    """
+    folded = fold_iast(sentence).replace(" ", "")
+    return hashlib.blake2b(folded.encode("utf-8"), digest_size=16).hexdigest()
@@ -1,14 +1,39 @@
-import os
 import argparse
-from openai import OpenAI
-from tqdm import tqdm
+import asyncio
+import functools
 import json
 import re
-import pandas as pd
 
+from comparator_filter import (
+    UNRESOLVED,
+    add_prefilter_args,
+    find_comparators,
+    format_hints,
+)
+from dedup import Deduplicator, add_dedup_args, count_jobs
+from guided_decoding import add_guided_args, request_options
+from llm_client import (
+    add_client_args,
+    client_from_args,
+    dispatch_from_args,
+    run_bounded,
+)
+from postprocess import (
+    PostProcessor,
+    add_postprocess_args,
+    post_processor_from_args,
+    repair_json,
+    report_failure,
+)
+from record_io import ModelSinks, add_output_args, iter_tsv
+from self_consistency import (
+    add_sampling_args,
+    parse_choices,
+    sampling_options,
+    vote,
+)
+from text_normalization import fold_iast
 
-client = OpenAI(base_url="http://localhost:8000/v1", api_key="token-123")
-MODEL_NAME = "/home/himanshu.dutta/hf_models/llama-3.1-8b-instruct/"
 
 SYSTEM_PROMPT = """You are a highly knowledgeable language model specializing in classical Sanskrit poetics. Your task is to classify a given prose passage in Sanskrit (Romanized) into one of four categories based on the presence of the figure of speech called Upamā alaṅkāra.
 
@@ -67,56 +92,463 @@ Input: {sentence}
 Output: 
 """
 
-
-def main(args):
-    sentences = pd.read_csv(args.input_file_path, sep="\t")["sentence"].tolist()
-    outputs = list()
-
-    for sentence in tqdm(sentences):
-        response = ""
-        user_prompt = USER_PROMPT_TEMPLATE.format(sentence=sentence)
+HINT_TEMPLATE = """
+Possible comparators (upamādyotaka) found by a rule-based matcher: {hints}"""
+
+PREFILTER_REASON = (
+    "No upamādyotaka found by the rule-based comparator pre-filter; not sent "
+    "to the model."
+)
+
+LABELS = ["pūrṇopamā", "luptopamā", "none"]
+_FOLDED_LABELS = {fold_iast(label): label for label in LABELS}
+
+# Field order asked of the model, and the guided-decoding task for each.
+# With the label first, a streamed completion can be closed as soon as the
+# label is in; label-only leaves the reason out altogether.
+OUTPUT_ORDERS = {
+    "reason-first": "classification",
+    "label-first": "classification-label-first",
+    "label-only": "classification-label-only",
+}
+_REASON_LINE = "   - reason: A text explanation of how the elements of Upamā alaṅkāra are identified or absent.\n"
+_LABEL_LINE = "   - label: One of the categories: Pūrṇopamā, Luptopamā, None.\n"
+_OUTPUT_JSON = re.compile(r'\{\{"reason": (".*?"), "label": (".*?")\}\}')
+_LABEL_VALUE = re.compile(r'"label"\s*:\s*"([^"]*)"', re.IGNORECASE)
+
+
+def system_prompt(order="reason-first"):
+    """SYSTEM_PROMPT with the output format and examples in `order`."""
+    if order == "label-first":
+        prompt = SYSTEM_PROMPT.replace(
+            _REASON_LINE + _LABEL_LINE, _LABEL_LINE + _REASON_LINE
+        )
+        return _OUTPUT_JSON.sub(r'{{"label": \2, "reason": \1}}', prompt)
+    if order == "label-only":
+        prompt = SYSTEM_PROMPT.replace(_REASON_LINE, "")
+        return _OUTPUT_JSON.sub(r'{{"label": \2}}', prompt)
+    return SYSTEM_PROMPT
+
+
+SYSTEM_PROMPTS = {order: system_prompt(order) for order in OUTPUT_ORDERS}
+
+
+def build_messages(sentence, comparators=None, order="reason-first"):
+    user_prompt = USER_PROMPT_TEMPLATE.format(sentence=sentence)
+    if comparators:
+        user_prompt = (
+            HINT_TEMPLATE.format(hints=format_hints(comparators)) + user_prompt
+        )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPTS[order]},
+        {
+            "role": "user",
+            "content": user_prompt,
+        },
+    ]
+
+
+def canonical_label(label):
+    """The label in LABELS that `label` spells up to diacritics, else `label`."""
+    return _FOLDED_LABELS.get(fold_iast(label), label)
+
+
+def streamed_label(content):
+    """The label of a possibly unfinished completion, once it is complete and valid."""
+    match = _LABEL_VALUE.search(content)
+    if match is None:
+        return None
+    label = canonical_label(match.group(1).lower())
+    return label if label in LABELS else None
+
+
+def has_label(content):
+    return streamed_label(content) is not None
+
+
+def response_contents(response):
+    """Choice contents, with those cut off by --stop-at-label closed into JSON.
+
+    Only choices whose stream was closed early are completed; any other
+    malformed output is left to fail parsing (or to --postprocess repair).
+    """
+    return [
+        (
+            closed_content(choice.message.content)
+            if getattr(choice, "stopped_early", False)
+            else choice.message.content
+        )
+        for choice in response.choices
+    ]
+
+
+def closed_content(content):
+    """A completion whose stream was closed after the label, as a JSON object.
+
+    Fields before the label (the reason, in reason-first order) are kept
+    when the text up to the label parses; anything after it is dropped.
+    """
+    try:
+        json.loads(content)
+        return content
+    except ValueError:
+        if streamed_label(content) is None:
+            return content
+        match = _LABEL_VALUE.search(content)
         try:
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {
-                        "role": "user",
-                        "content": user_prompt,
-                    },
-                ],
-                max_tokens=1024,
+            return json.dumps(
+                json.loads(content[: match.end()] + "}"), ensure_ascii=False
             )
-            response = response.choices[0].message.content.strip().lower()
-            # response = response.replace("\n", " ")
-            response = json.loads(response)
-
-            reasoning = response["reason"]
-            label = response["label"]
-            outputs.append(
-                {
-                    "sentence": sentence,
-                    "reasoning": reasoning,
-                    "label": label,
-                    "human_label": "",
-                    "is_reasoning_correct": True,
-                }
-            )
-
-        except Exception as e:
-            print(f"Exception for sentence: {sentence}")
-            print(f"Response: {response}")
-    print("Number of successful sentences: ", len(outputs))
-    with open(args.output_file_path, "w", encoding="utf-8") as fp:
-        json.dump(outputs, fp, indent=4, ensure_ascii=False)
+        except ValueError:
+            return json.dumps({"label": match.group(1)}, ensure_ascii=False)
+
+
+def parse_content(content, repair=False):
+    content = content.strip().lower()
+    response = repair_json(content) if repair else json.loads(content)
+    # Label-only and early-stopped completions carry no reason.
+    return {"reason": response.get("reason", ""), "label": response["label"]}
+
+
+def parse_response(
+    sentence, contents, model=None, samples=1, clean=False, comparators=None
+):
+    parse = functools.partial(parse_content, repair=clean)
+    agreement = None
+    if samples > 1:
+        # Majority label across the samples, explained by the first sample
+        # that chose it.
+        parsed = parse_choices(contents, parse)
+        if clean:
+            for sample in parsed:
+                sample["label"] = canonical_label(sample["label"])
+        label, agreement = vote([sample["label"] for sample in parsed])
+        reasoning = next(s["reason"] for s in parsed if s["label"] == label)
+    else:
+        response = parse(contents[0])
+        reasoning = response["reason"]
+        label = response["label"]
+        if clean:
+            label = canonical_label(label)
+    record = {
+        "sentence": sentence,
+        "reasoning": reasoning,
+        "label": label,
+        "human_label": "",
+        "is_reasoning_correct": True,
+    }
+    if agreement is not None:
+        record["agreement"] = agreement
+    if comparators is not None:
+        record["comparators"] = comparators
+    if model is not None:
+        record["model"] = model
+    return record
+
+
+def prefilter(llm, sentence, mode, model=None):
+    """Run the comparator pre-pass for `mode` ("off", "hints" or "skip").
+
+    Returns (comparators, record). `record` is set when the sentence is
+    answered locally: in "skip" mode, a sentence without any candidate
+    comparator is not sent and gets the label UNRESOLVED.
+    """
+    if mode == "off":
+        return None, None
+    comparators = find_comparators(sentence)
+    if comparators or mode != "skip":
+        return comparators, None
+    llm.metrics.add_skipped()
+    record = {
+        "sentence": sentence,
+        "reasoning": PREFILTER_REASON,
+        "label": UNRESOLVED,
+        "human_label": "",
+        "is_reasoning_correct": True,
+        "comparators": comparators,
+    }
+    if model is not None:
+        record["model"] = model
+    return comparators, record
+
+
+def request_args(
+    sentence,
+    comparators=None,
+    guided=False,
+    samples=1,
+    order="reason-first",
+    stop_at_label=False,
+):
+    return build_messages(sentence, comparators, order), {
+        "stop_when": has_label if stop_at_label else None,
+        **request_options(OUTPUT_ORDERS[order], guided),
+        **sampling_options(samples),
+    }
+
+
+def request_classification(
+    llm,
+    sentence,
+    comparators=None,
+    model=None,
+    guided=False,
+    samples=1,
+    order="reason-first",
+    stop_at_label=False,
+):
+    messages, options = request_args(
+        sentence, comparators, guided, samples, order, stop_at_label
+    )
+    return response_contents(llm.chat(messages, model=model, **options))
+
+
+async def request_classification_async(
+    llm,
+    sentence,
+    comparators=None,
+    model=None,
+    guided=False,
+    samples=1,
+    order="reason-first",
+    stop_at_label=False,
+):
+    messages, options = request_args(
+        sentence, comparators, guided, samples, order, stop_at_label
+    )
+    return response_contents(await llm.achat(messages, model=model, **options))
+
+
+def classify_sentence(
+    llm,
+    sentence,
+    model=None,
+    guided=False,
+    prefilter_mode="off",
+    samples=1,
+    clean=False,
+    order="reason-first",
+    stop_at_label=False,
+):
+    contents = ""
+    try:
+        comparators, record = prefilter(llm, sentence, prefilter_mode, model)
+        if record is not None:
+            return record
+        contents = request_classification(
+            llm, sentence, comparators, model, guided, samples, order, stop_at_label
+        )
+        return parse_response(sentence, contents, model, samples, clean, comparators)
+
+    except Exception as e:
+        report_failure(llm, sentence, model, e, contents)
+        return None
+
+
+async def prefilter_and_request_async(
+    llm,
+    sentence,
+    model=None,
+    guided=False,
+    prefilter_mode="off",
+    samples=1,
+    order="reason-first",
+    stop_at_label=False,
+):
+    """Run the pre-pass and the request for `sentence`, without parsing.
+
+    Returns the finished record for a pre-filtered sentence, the pending
+    `(sentence, model, contents, comparators)` for `finish_async`, or None
+    on failure.
+    """
+    try:
+        comparators, record = prefilter(llm, sentence, prefilter_mode, model)
+        if record is not None:
+            return record
+        contents = await request_classification_async(
+            llm, sentence, comparators, model, guided, samples, order, stop_at_label
+        )
+        return sentence, model, contents, comparators
+    except Exception as e:
+        report_failure(llm, sentence, model, e, "")
+        return None
+
+
+async def finish_async(llm, pending, samples=1, post=None):
+    # Pre-filtered sentences and failures arrive already finished.
+    if not isinstance(pending, tuple):
+        return pending
+    post = post or PostProcessor()
+    sentence, model, contents, comparators = pending
+    try:
+        return await post.run(
+            parse_response, sentence, contents, model, samples, post.clean, comparators
+        )
+    except Exception as e:
+        report_failure(llm, sentence, model, e, contents)
+        return None
+
+
+async def classify_sentence_async(
+    llm,
+    sentence,
+    model=None,
+    guided=False,
+    prefilter_mode="off",
+    samples=1,
+    post=None,
+    order="reason-first",
+    stop_at_label=False,
+):
+    pending = await prefilter_and_request_async(
+        llm, sentence, model, guided, prefilter_mode, samples, order, stop_at_label
+    )
+    return await finish_async(llm, pending, samples, post)
+
+
+async def classify_all_async(
+    llm,
+    jobs,
+    max_in_flight,
+    on_result,
+    guided=False,
+    prefilter_mode="off",
+    samples=1,
+    post=None,
+    order="reason-first",
+    stop_at_label=False,
+    total=None,
+):
+    post = post or PostProcessor()
+
+    async def request(job):
+        model, sentence = job
+        return await prefilter_and_request_async(
+            llm, sentence, model, guided, prefilter_mode, samples, order, stop_at_label
+        )
+
+    async def postprocess(pending):
+        return await finish_async(llm, pending, samples, post)
+
+    try:
+        await run_bounded(
+            jobs,
+            request,
+            max_in_flight,
+            on_result,
+            total=total,
+            warmup=llm.prefix_warmup,
+            postprocess=postprocess,
+        )
+    finally:
+        await llm.aclose()
 
 
-if __name__ == "__main__":
+def main(args):
+    llm = client_from_args(args)
+    post = post_processor_from_args(args)
+    sink = ModelSinks(args.output_file_path, llm.models, resume=args.resume)
+
+    def read_jobs():
+        return sink.jobs(iter_tsv(args.input_file_path), sentence_of=lambda item: item)
+
+    # A counting pass over the input, so progress shows the job count.
+    total = count_jobs(read_jobs(), args.dedup)
+    jobs, on_result = read_jobs(), sink.add
+    dedup = None
+    if args.dedup:
+        dedup = Deduplicator(sink.add)
+        jobs, on_result = dedup.jobs(jobs), dedup.add
+
+    jobs, max_in_flight, async_mode = dispatch_from_args(args, jobs)
+    try:
+        if async_mode:
+            asyncio.run(
+                classify_all_async(
+                    llm,
+                    jobs,
+                    max_in_flight,
+                    on_result,
+                    args.guided,
+                    args.prefilter,
+                    args.samples,
+                    post,
+                    args.output_order,
+                    args.stop_at_label,
+                    total,
+                )
+            )
+        else:
+            from tqdm import tqdm
+
+            for idx, (model, sentence) in enumerate(tqdm(jobs, total=total)):
+                record = classify_sentence(
+                    llm,
+                    sentence,
+                    model=model,
+                    guided=args.guided,
+                    prefilter_mode=args.prefilter,
+                    samples=args.samples,
+                    clean=post.clean,
+                    order=args.output_order,
+                    stop_at_label=args.stop_at_label,
+                )
+                on_result(idx, record)
+    finally:
+        llm.report(args.output_file_path)
+        llm.close()
+        post.close()
+        sink.close()
+
+    print("Number of successful sentences: ", sink.count)
+    if dedup is not None:
+        dedup.report()
+
+
+def add_early_stop_args(parser):
+    parser.add_argument(
+        "--output-order",
+        choices=list(OUTPUT_ORDERS),
+        default="reason-first",
+        help="Order of the fields asked of the model. label-first puts the "
+        "label before the reason; label-only asks for the label alone and "
+        "records no reasoning.",
+    )
+    parser.add_argument(
+        "--stop-at-label",
+        action="store_true",
+        help="Stream each completion and close it as soon as a valid label "
+        "has been read, so the server stops generating. With label-first "
+        "the reason is then never generated or recorded.",
+    )
+
+
+def build_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input-file-path", type=str, required=True)
     parser.add_argument("-o", "--output-file-path", type=str, required=True)
-    parser.add_argument("-b", "--batch-size", type=int, default=8)
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Maximum number of in-flight requests in async mode.",
+    )
+    parser.add_argument(
+        "--async-mode",
+        action="store_true",
+        help="Dispatch requests concurrently with AsyncOpenAI.",
+    )
+    add_output_args(parser)
+    add_dedup_args(parser)
+    add_client_args(parser)
+    add_guided_args(parser)
+    add_prefilter_args(parser)
+    add_early_stop_args(parser)
+    add_sampling_args(parser)
+    add_postprocess_args(parser)
+    return parser
 
-    args = parser.parse_args()
 
-    main(args)
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -1,45 +1,348 @@
 import json
 import argparse
-from sklearn.metrics import (
-    accuracy_score,
-    precision_score,
-    recall_score,
-    f1_score,
-    classification_report,
-)
+import glob
+import sys
 
+import numpy as np
 
-def main(json_path: str, results_path: str):
-    with open(json_path, "r") as fp:
-        data = json.load(fp)
+from comparator_filter import UNRESOLVED
+from incremental_eval import EvalState, report_diff
+from record_io import EVAL_COLUMNS, iter_records, record_hash
 
-    predicted = [itm["label"] for itm in data]
-    actual = [itm["human_label"] for itm in data]
-    is_reasoning_correct = [int(itm["is_reasoning_correct"]) for itm in data]
 
-    acc = accuracy_score(actual, predicted)
-    prec = precision_score(actual, predicted, average="weighted")
-    rec = recall_score(actual, predicted, average="weighted")
-    f1 = f1_score(actual, predicted, average="weighted")
+METRICS = ("accuracy", "precision", "recall", "f1")
+COLUMNS = EVAL_COLUMNS["classification"]
 
+
+def record_vector(itm):
+    """(gold label, predicted label, reasoning correct) of one record."""
+    return [
+        str(itm["human_label"]),
+        str(itm["label"]),
+        int(itm.get("is_reasoning_correct", 0)),
+    ]
+
+
+def empty_totals():
+    return {"confusion": {}, "reasoning_correct": 0, "count": 0, "abstained": 0}
+
+
+def accumulate(totals, vector, count=1):
+    """Add `count` copies of a record vector to running totals (negative removes).
+
+    Sentences the comparator pre-filter left unresolved are abstentions: they
+    are counted apart and kept out of the confusion matrix.
+    """
+    gold, predicted, reasoning_correct = vector
+    if predicted == UNRESOLVED:
+        totals["abstained"] += count
+        return
+    cell = f"{gold}\t{predicted}"
+    totals["confusion"][cell] = totals["confusion"].get(cell, 0) + count
+    if not totals["confusion"][cell]:
+        del totals["confusion"][cell]
+    totals["reasoning_correct"] += reasoning_correct * count
+    totals["count"] += count
+
+
+def confusion_matrices(actual, predicted, num_labels, samples=None):
+    """Confusion matrix of the codes, or one per row of `samples` indices.
+
+    Rows are gold labels and columns predictions. With `samples` of shape
+    (resamples, n), all matrices come out of a single bincount.
+    """
+    cells = actual * num_labels + predicted
+    if samples is None:
+        return np.bincount(cells, minlength=num_labels**2).reshape(
+            num_labels, num_labels
+        )
+    offsets = np.arange(len(samples))[:, None] * num_labels**2
+    counts = np.bincount(
+        (cells[samples] + offsets).ravel(), minlength=len(samples) * num_labels**2
+    )
+    return counts.reshape(len(samples), num_labels, num_labels)
+
+
+def divide(numerator, denominator):
+    # Zero where the denominator is zero, as sklearn's zero_division=0 does.
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros(np.broadcast(numerator, denominator).shape),
+        where=denominator > 0,
+    )
+
+
+def scores_from_confusion(confusion):
+    """Accuracy and support-weighted P/R/F1 of one or a stack of confusion matrices.
+
+    Matches sklearn's `average="weighted"` with zero division scored as 0.
+    """
+    true_positives = np.diagonal(confusion, axis1=-2, axis2=-1)
+    support = confusion.sum(axis=-1)
+    predicted = confusion.sum(axis=-2)
+    total = support.sum(axis=-1)
+
+    precision = divide(true_positives, predicted)
+    recall = divide(true_positives, support)
+    f1 = divide(2 * precision * recall, precision + recall)
+    weights = divide(support, total[..., None])
+    return {
+        "accuracy": divide(true_positives.sum(axis=-1), total),
+        "precision": (precision * weights).sum(axis=-1),
+        "recall": (recall * weights).sum(axis=-1),
+        "f1": (f1 * weights).sum(axis=-1),
+    }
+
+
+def bootstrap_intervals(
+    actual, predicted, num_labels, resamples=1000, confidence=0.95, seed=None
+):
+    """Percentile bootstrap intervals for the metrics in `scores_from_confusion`.
+
+    Resamples are drawn and scored in chunks so memory stays bounded for
+    large files.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(actual)
+    chunk = max(1, (1 << 22) // max(1, n))
+    scores = {metric: list() for metric in METRICS}
+    for start in range(0, resamples, chunk):
+        samples = rng.integers(0, n, size=(min(chunk, resamples - start), n))
+        confusion = confusion_matrices(actual, predicted, num_labels, samples)
+        for metric, values in scores_from_confusion(confusion).items():
+            scores[metric].append(values)
+
+    alpha = (1 - confidence) / 2
+    return {
+        metric: [
+            float(bound)
+            for bound in np.quantile(np.concatenate(values), [alpha, 1 - alpha])
+        ]
+        for metric, values in scores.items()
+    }
+
+
+def format_report(labels, confusion):
+    """Per-label precision/recall/F1/support table, like sklearn's report."""
+    true_positives = np.diagonal(confusion)
+    support = confusion.sum(axis=1)
+    precision = divide(true_positives, confusion.sum(axis=0))
+    recall = divide(true_positives, support)
+    f1 = divide(2 * precision * recall, precision + recall)
+
+    width = max(len(label) for label in labels + ["weighted avg"])
+    lines = [f"{'':>{width}} precision    recall  f1-score   support", ""]
+    for i, label in enumerate(labels):
+        lines.append(
+            f"{label:>{width}} {precision[i]:9.2f} {recall[i]:9.2f} "
+            f"{f1[i]:9.2f} {support[i]:9d}"
+        )
+    scores = scores_from_confusion(confusion)
+    lines.append("")
+    lines.append(
+        f"{'weighted avg':>{width}} {scores['precision']:9.2f} "
+        f"{scores['recall']:9.2f} {scores['f1']:9.2f} {support.sum():9d}"
+    )
+    return "\n".join(lines)
+
+
+def metrics_from_totals(
+    totals, vectors=(), resamples=0, confidence=0.95, seed=None, verbose=True
+):
+    """Metrics from running totals; `vectors` (in input order) feed the bootstrap."""
+    cells = [(cell.split("\t"), count) for cell, count in totals["confusion"].items()]
+    labels = sorted({label for pair, _ in cells for label in pair})
+    codes = {label: code for code, label in enumerate(labels)}
+    confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    for (gold, predicted), count in cells:
+        confusion[codes[gold], codes[predicted]] = count
+
+    count = totals["count"]
     results = {
-        "accuracy": acc,
-        "precision": prec,
-        "recall": rec,
-        "f1": f1,
-        "per_corr_reasoning": sum(is_reasoning_correct) / len(data),
+        metric: float(value)
+        for metric, value in scores_from_confusion(confusion).items()
     }
+    results["per_corr_reasoning"] = (
+        totals["reasoning_correct"] / count if count else 0.0
+    )
+    results["abstentions"] = totals["abstained"]
+    results["labels"] = labels
+    results["confusion_matrix"] = confusion.tolist()
+    if resamples and count:
+        vectors = [vector for vector in vectors if vector[1] != UNRESOLVED]
+        actual = np.array([codes[vector[0]] for vector in vectors])
+        predicted = np.array([codes[vector[1]] for vector in vectors])
+        results["confidence"] = confidence
+        results["intervals"] = bootstrap_intervals(
+            actual, predicted, len(labels), resamples, confidence, seed
+        )
 
-    print(classification_report(actual, predicted))
+    if verbose and count:
+        print(format_report(labels, confusion))
+    if verbose and totals["abstained"]:
+        print(f"Abstained on {totals['abstained']} sentences left unresolved")
+    return results
 
-    with open(results_path, "w") as fp:
-        json.dump(results, fp)
 
+def is_labelled(itm):
+    return "label" in itm and "human_label" in itm
 
-if __name__ == "__main__":
+
+def report_skipped(skipped, usable):
+    """Report records without both labels; raise ValueError if none has them."""
+    if skipped:
+        print(f"Skipped {skipped} records without a label or human_label")
+    if not usable:
+        raise ValueError("no record has both a label and a human_label")
+
+
+def labelled_vectors(data):
+    """Vectors of the records that have both labels."""
+    vectors = list()
+    skipped = 0
+    for itm in data:
+        if is_labelled(itm):
+            vectors.append(record_vector(itm))
+        else:
+            skipped += 1
+    report_skipped(skipped, len(vectors))
+    return vectors
+
+
+def compute_metrics(data, resamples=0, confidence=0.95, seed=None, verbose=True):
+    vectors = labelled_vectors(data)
+    totals = empty_totals()
+    for vector in vectors:
+        accumulate(totals, vector)
+    return metrics_from_totals(totals, vectors, resamples, confidence, seed, verbose)
+
+
+def compute_metrics_incremental(
+    state, path, resamples=0, confidence=0.95, seed=None, verbose=True
+):
+    """`compute_metrics` for `path`, reusing the vectors and totals in `state`.
+
+    An unchanged file is not opened; in a changed JSONL file only the new or
+    edited lines are decoded.
+    """
+    if state.fresh(path, [path]):
+        entry = state.entries[path]
+        report_diff(path)
+    else:
+        vectors = dict()
+
+        def hash_record(itm):
+            if not is_labelled(itm):
+                return None
+            vector = record_vector(itm)
+            h = record_hash(vector)
+            vectors[h] = vector
+            return h
+
+        hashes, lines = state.record_hashes(path, path, hash_record, COLUMNS)
+        usable = [h for h in hashes if h is not None]
+        report_skipped(len(hashes) - len(usable), len(usable))
+        entry, added, removed = state.update(
+            path,
+            [path],
+            usable,
+            lambda missing: {h: vectors[h] for h in missing},
+            accumulate,
+            empty_totals,
+            lines=lines,
+        )
+        report_diff(path, added, removed)
+    vectors = [entry["vectors"][h] for h in entry["order"]]
+    return metrics_from_totals(
+        entry["totals"], vectors, resamples, confidence, seed, verbose
+    )
+
+
+def expand_paths(patterns):
+    paths = list()
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def main(args):
+    """Evaluate every file matched by `args.file`.
+
+    One file gives the flat results object; several give a dict keyed by
+    file path, leaving out files without usable records. With `args.state`,
+    unchanged files and records are not re-scored.
+    """
+    paths = expand_paths(args.file)
+    state = EvalState(args.state) if args.state else None
+    results = dict()
+    for path in paths:
+        if len(paths) > 1 and state is None:
+            print(path)
+        try:
+            if state is None:
+                results[path] = compute_metrics(
+                    iter_records(path, columns=COLUMNS),
+                    args.bootstrap,
+                    args.confidence,
+                    args.seed,
+                    verbose=not args.quiet,
+                )
+            else:
+                results[path] = compute_metrics_incremental(
+                    state,
+                    path,
+                    args.bootstrap,
+                    args.confidence,
+                    args.seed,
+                    verbose=not args.quiet,
+                )
+        except ValueError as e:
+            # Globs over results/ also match metric and *.perf.json reports,
+            # which are JSON objects, not record arrays.
+            print(f"Skipping {path}: {e}")
+    if state is not None:
+        state.save()
+    if not results:
+        sys.exit("No file had records to evaluate.")
+    if len(paths) == 1:
+        results = results[paths[0]]
+
+    with open(args.results, "w") as fp:
+        json.dump(results, fp, indent=4, ensure_ascii=False)
+
+
+def build_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-f", "--file", type=str, required=True)
+    parser.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Result files or glob patterns, e.g. 'results/*/upma_classification/*.json'",
+    )
     parser.add_argument("-r", "--results", type=str, required=True)
-    args = parser.parse_args()
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=1000,
+        help="Bootstrap resamples for confidence intervals (0 to skip).",
+    )
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--state",
+        type=str,
+        default=None,
+        help="Incremental mode: keep per-record vectors and totals in this file "
+        "and on later runs re-score only the files and records that changed.",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Don't print per-label reports."
+    )
+    return parser
+
 
-    main(args.file, args.results)
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -0,0 +1,57 @@
+import pytest
+
+from comparator_filter import AhoCorasick, find_comparators
+
+
+def naive_matches(patterns, text):
+    return sorted(
+        (start, start + len(pattern), pattern)
+        for pattern in patterns
+        for start in range(len(text))
+        if text.startswith(pattern, start)
+    )
+
+
+@pytest.mark.parametrize(
+    "patterns, text",
+    [
+        (["he", "she", "his", "hers"], "ushershishe"),
+        (["a", "aa", "aaa"], "aaaa"),
+        (["iva", "va", "vat", "ivā"], "dīptamivānalam vanavat iva"),
+    ],
+)
+def test_aho_corasick_finds_every_overlapping_match(patterns, text):
+    matcher = AhoCorasick((pattern, pattern) for pattern in patterns)
+    assert sorted(matcher.iter(text)) == naive_matches(patterns, text)
+
+
+@pytest.mark.parametrize(
+    "sentence, expected",
+    [
+        ("rāmaḥ kālāgnisadṛśaḥ krodhe।", [("sadṛśa", "sadṛś")]),
+        ("sītā anugatā rāmaṃ śaśinaṃ rohiṇī yathā ।", [("yathā", "yathā")]),
+        ("mātari prahr̥tam dviṣadvat।", [("vat", "vat")]),
+        # The longest overlapping form wins: nibh is inside sannibh.
+        ("meghasannibhaḥ", [("sannibha", "sannibh")]),
+        ("marutsakhābham", [("ābha", "ābh")]),
+        ("rāmo vā lakṣmaṇo vā", [("vā", "vā"), ("vā", "vā")]),
+    ],
+)
+def test_comparators_found(sentence, expected):
+    spans = find_comparators(sentence)
+    assert [(span["comparator"], span["form"]) for span in spans] == expected
+    for span in spans:
+        assert sentence.lower()[span["start"] : span["end"]] == span["form"]
+
+
+@pytest.mark.parametrize(
+    "sentence",
+    [
+        "sa gacchati vanam",
+        # vā only counts as a whole word, ābh/nibh not at the start of one.
+        "vārāṇasīṃ gacchati",
+        "nibhṛtaḥ ābhāti",
+    ],
+)
+def test_no_comparator(sentence):
+    assert find_comparators(sentence) == []
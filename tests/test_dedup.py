@@ -0,0 +1,64 @@
+from dedup import Deduplicator, count_jobs
+
+
+def run(jobs):
+    """Send the deduplicated jobs in order; return what each position got."""
+    results = dict()
+    dedup = Deduplicator(lambda idx, result: results.setdefault(idx, result))
+    sent = list()
+    for idx, (model, item) in enumerate(dedup.jobs(jobs)):
+        sent.append((model, item))
+        dedup.add(idx, {"sentence": item, "label": f"{model}:{len(sent)}"})
+    return sent, results
+
+
+def test_each_verse_is_sent_once_per_model():
+    jobs = [
+        ("a", "rāmaḥ kālāgnisadṛśaḥ krodhe।"),
+        ("b", "rāmaḥ kālāgnisadṛśaḥ krodhe।"),
+        ("a", "Rāmaḥ  kālāgnisadṛśaḥ krodhe ।।"),
+        ("a", "sītā rohiṇī yathā"),
+    ]
+    sent, results = run(jobs)
+    assert sent == [
+        ("a", "rāmaḥ kālāgnisadṛśaḥ krodhe।"),
+        ("b", "rāmaḥ kālāgnisadṛśaḥ krodhe।"),
+        ("a", "sītā rohiṇī yathā"),
+    ]
+    # The duplicate gets the first one's result, with its own spelling.
+    assert results[2] == {"sentence": jobs[2][1], "label": "a:1"}
+    assert [results[idx]["label"] for idx in range(4)] == ["a:1", "b:2", "a:1", "a:3"]
+
+
+def test_duplicates_seen_before_the_result_get_it_on_arrival():
+    results = dict()
+    dedup = Deduplicator(lambda idx, result: results.setdefault(idx, result))
+    jobs = dedup.jobs([("m", {"sentence": "mukhaṃ candra iva", "id": 1})] * 3)
+    assert len(list(jobs)) == 1
+    assert results == {}
+    dedup.add(0, {"sentence": "mukhaṃ candra iva", "id": 1, "label": "none"})
+    assert sorted(results) == [0, 1, 2]
+    assert all(record["label"] == "none" for record in results.values())
+
+
+def test_dict_items_keep_their_own_fields():
+    results = dict()
+    dedup = Deduplicator(lambda idx, result: results.setdefault(idx, result))
+    items = [{"sentence": "vadanaṃ candra iva ।", "id": i} for i in range(2)]
+    [(_, sent)] = dedup.jobs(("m", item) for item in items)
+    dedup.add(0, {**sent, "components": {"upamāna": "candra"}})
+    assert results[1] == {**items[1], "components": {"upamāna": "candra"}}
+
+
+def test_failed_requests_stay_failed_for_duplicates():
+    results = dict()
+    dedup = Deduplicator(lambda idx, result: results.setdefault(idx, result))
+    list(dedup.jobs([("m", "x iva y"), ("m", "x iva y")]))
+    dedup.add(0, None)
+    assert results == {0: None, 1: None}
+
+
+def test_count_jobs():
+    jobs = [("m", "x iva y"), ("m", "X iva y ।"), ("n", "x iva y")]
+    assert count_jobs(iter(jobs)) == 3
+    assert count_jobs(iter(jobs), dedup=True) == 2
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from few_shot import ExampleIndex, examples_from_prompt, load_or_build_index
+from purnopama_component_identification import SYSTEM_PROMPT
+
+
+def example(sentence, construe=None):
+    return {"sentence": sentence, "components": {}, "construe": construe}
+
+
+EXAMPLES = [
+    example("rāmaḥ kālāgnisadṛśaḥ krodhe", "rāmaḥ krodhe kālāgnisadṛśaḥ"),
+    example("sītā rāmaṃ śaśinaṃ rohiṇī yathā anugatā"),
+    example("mukhaṃ candra iva śobhate"),
+    example("vadanaṃ candra iva kāntam", "vadanaṃ candraḥ iva kāntam"),
+    example("mātari prahṛtaṃ dviṣadvat"),
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return ExampleIndex.build(EXAMPLES)
+
+
+def test_nearest_example_first(index):
+    selected = index.query("mukhaṃ candra iva śobhate", k=2)
+    assert selected[0]["sentence"] == "vadanaṃ candra iva kāntam"
+
+
+def test_query_never_returns_the_sentence_itself(index):
+    # Same verse after normalization: different case and a danda.
+    selected = index.query("Mukhaṃ candra iva śobhate ।", k=len(EXAMPLES))
+    sentences = [example["sentence"] for example in selected]
+    assert "mukhaṃ candra iva śobhate" not in sentences
+    assert len(sentences) == len(EXAMPLES) - 1
+
+
+def test_shared_comparator_outranks_shared_characters(index):
+    selected = index.query("kamalaṃ yathā", k=1)
+    assert selected[0]["sentence"] == "sītā rāmaṃ śaśinaṃ rohiṇī yathā anugatā"
+
+
+def test_require_keeps_examples_with_the_field(index):
+    selected = index.query("mukhaṃ candra iva śobhate", k=3, require="construe")
+    assert [example["sentence"] for example in selected] == [
+        "vadanaṃ candra iva kāntam",
+        "rāmaḥ kālāgnisadṛśaḥ krodhe",
+    ]
+
+
+def test_duplicate_examples_are_indexed_once():
+    index = ExampleIndex.build(EXAMPLES + [example("Mātari prahṛtaṃ dviṣadvat ।")])
+    assert len(index.examples) == len(EXAMPLES)
+
+
+def test_saved_index_answers_the_same(index, tmp_path):
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = ExampleIndex.load(path)
+    for sentence in ("kamalaṃ yathā", "dviṣadvat hataḥ"):
+        assert loaded.query(sentence) == index.query(sentence)
+
+
+def test_index_is_rebuilt_when_a_source_changes(tmp_path):
+    source = tmp_path / "gold.json"
+    components = {"upameya": "a", "upamāna": "b", "sādhāraṇadharma": "c"}
+    records = [
+        {
+            "sentence": "mukhaṃ candra iva śobhate",
+            "human_label": "pūrṇopamā",
+            "components": {**components, "upamādyotaka": "iva"},
+        }
+    ]
+    source.write_text(json.dumps(records, ensure_ascii=False), "utf-8")
+    path = str(tmp_path / "index.npz")
+    assert len(load_or_build_index(path, [str(source)]).examples) == 1
+
+    records.append({**records[0], "sentence": "kamalaṃ yathā śobhate"})
+    source.write_text(json.dumps(records, ensure_ascii=False), "utf-8")
+    assert len(load_or_build_index(path, [str(source)]).examples) == 2
+
+
+def test_prompt_examples_are_parsed():
+    examples = examples_from_prompt(SYSTEM_PROMPT)
+    assert len(examples) == 4
+    assert examples[0]["sentence"] == "rāmaḥ kālāgnisadṛśaḥ krodhe।"
+    assert examples[0]["components"]["upamāna"] == "kālāgni"
@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+from incremental_eval import EvalState
+from upma_classification_eval import (
+    accumulate,
+    compute_metrics,
+    compute_metrics_incremental,
+    empty_totals,
+)
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as fp:
+        for record in records:
+            fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+    # Same-size rewrites within the mtime granularity would look unchanged.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def add_values(totals, vector, count):
+    totals["sum"] += vector * count
+    totals["count"] += count
+
+
+class Scorer:
+    """Scores records by their "value", counting how many it decoded."""
+
+    def __init__(self, state, path):
+        self.state = state
+        self.path = path
+        self.decoded = 0
+
+    def hash_record(self, record):
+        self.decoded += 1
+        return str(record["value"])
+
+    def run(self):
+        hashes, lines = self.state.record_hashes(self.path, self.path, self.hash_record)
+        return self.state.update(
+            self.path,
+            [self.path],
+            hashes,
+            lambda missing: {h: int(h) for h in missing},
+            add_values,
+            lambda: {"sum": 0, "count": 0},
+            lines=lines,
+        )
+
+
+@pytest.fixture
+def scorer(tmp_path):
+    return Scorer(EvalState(str(tmp_path / "state.json")), str(tmp_path / "in.jsonl"))
+
+
+def test_totals_follow_added_and_removed_records(scorer):
+    write_jsonl(scorer.path, [{"value": v} for v in (1, 2, 3)])
+    entry, added, removed = scorer.run()
+    assert (added, removed) == (3, 0)
+    assert entry["totals"] == {"sum": 6, "count": 3}
+
+    write_jsonl(scorer.path, [{"value": v} for v in (1, 3, 3, 10)])
+    entry, added, removed = scorer.run()
+    assert (added, removed) == (2, 1)
+    assert entry["totals"] == {"sum": 17, "count": 4}
+    assert entry["order"] == ["1", "3", "3", "10"]
+
+    write_jsonl(scorer.path, [])
+    entry, added, removed = scorer.run()
+    assert (added, removed) == (0, 4)
+    assert entry["totals"] == {"sum": 0, "count": 0}
+    assert entry["vectors"] == {}
+
+
+def test_only_new_or_edited_lines_are_decoded(scorer):
+    records = [{"value": v, "id": i} for i, v in enumerate((4, 5, 6))]
+    write_jsonl(scorer.path, records)
+    scorer.run()
+    assert scorer.decoded == 3
+
+    records[1]["value"] = 50
+    write_jsonl(scorer.path, records + [{"value": 7, "id": 3}])
+    entry, _, _ = scorer.run()
+    assert scorer.decoded == 5
+    assert entry["totals"] == {"sum": 67, "count": 4}
+
+
+def test_state_survives_a_save(scorer):
+    write_jsonl(scorer.path, [{"value": 1}, {"value": 2}])
+    scorer.run()
+    scorer.state.save()
+
+    state = EvalState(scorer.state.path)
+    assert state.fresh(scorer.path, [scorer.path])
+    write_jsonl(scorer.path, [{"value": 1}, {"value": 2}, {"value": 3}])
+    assert not state.fresh(scorer.path, [scorer.path])
+    reloaded = Scorer(state, scorer.path)
+    entry, added, removed = reloaded.run()
+    assert (added, removed, reloaded.decoded) == (1, 0, 1)
+    assert entry["totals"] == {"sum": 6, "count": 3}
+
+
+def test_changed_options_start_over(scorer):
+    write_jsonl(scorer.path, [{"value": 1}])
+    scorer.run()
+    assert not scorer.state.fresh(scorer.path, [scorer.path], {"fuzzy": True})
+
+
+def test_removing_a_record_undoes_adding_it():
+    totals = empty_totals()
+    accumulate(totals, ["p", "n", 0])
+    before = json.loads(json.dumps(totals))
+    accumulate(totals, ["n", "n", 1])
+    accumulate(totals, ["n", "n", 1], -1)
+    assert totals == before
+
+
+def test_incremental_classification_metrics_match_a_full_run(tmp_path):
+    path = str(tmp_path / "predictions.jsonl")
+    state = EvalState(str(tmp_path / "state.json"))
+    labels = ["pūrṇopamā", "luptopamā", "none"]
+    records = [
+        {"human_label": labels[i % 3], "label": labels[i * 7 % 3]} for i in range(30)
+    ]
+    for edit in range(3):
+        records = records[edit:] + [
+            {"human_label": "none", "label": labels[edit], "is_reasoning_correct": 1}
+        ]
+        write_jsonl(path, records)
+        incremental = compute_metrics_incremental(state, path, verbose=False)
+        assert incremental == compute_metrics(records, verbose=False)
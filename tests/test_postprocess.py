@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from postprocess import (
+    finish_components,
+    normalize_component,
+    repair_json,
+    validate_components,
+)
+
+
+EXPECTED = {"upameya": "rāma", "upamāna": "kālāgni"}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"upameya": "rāma", "upamāna": "kālāgni"}',
+        '```json\n{"upameya": "rāma", "upamāna": "kālāgni"}\n```',
+        'Output: {"upameya": "rāma", "upamāna": "kālāgni"} Explanation: ...',
+        "{“upameya”: “rāma”, “upamāna”: “kālāgni”}",
+        "{'upameya': 'rāma', 'upamāna': 'kālāgni'}",
+        '{"upameya": "rāma", "upamāna": "kālāgni",}',
+        '{"upameya": "rāma", "upamāna": "kālāgni',
+        '{"upameya": "rāma", "upamāna": "kālāgni",',
+    ],
+)
+def test_repair_json(text):
+    assert repair_json(text) == EXPECTED
+
+
+def test_repair_keeps_an_avagraha():
+    assert repair_json("{'upameya': 'svapne'pi'}") == {"upameya": "svapne'pi"}
+
+
+def test_repair_gives_up_without_an_object():
+    with pytest.raises(ValueError):
+        repair_json("upameya: rāma")
+    with pytest.raises(ValueError):
+        repair_json('{"upameya": rāma}')
+
+
+def test_normalize_component_strips_quotes_and_dandas():
+    assert normalize_component("“rāmaḥ।”") == "rāmaḥ"
+    assert normalize_component("  kāla   agni ") == "kāla agni"
+    assert normalize_component(None) is None
+
+
+def test_validation_against_the_sentence():
+    sentence = "sītā api anugatā rāmaṃ śaśinaṃ rohiṇī yathā"
+    components = {
+        "upameya": "sītā",
+        "upamāna": "rohiṇīm",
+        "sādhāraṇadharma": "anugata",
+        "upamādyotaka": "iva",
+        "explanation": "not checked",
+    }
+    assert validate_components(sentence, components) == {
+        "upameya": "exact",
+        "upamāna": "sandhi",
+        "sādhāraṇadharma": "sandhi",
+        "upamādyotaka": "missing",
+    }
+
+
+def test_absent_values_are_not_validated():
+    components = {"upameya": "None", "upamāna": "", "upamādyotaka": "iva"}
+    assert validate_components("himavān iva", components) == {"upamādyotaka": "exact"}
+
+
+def test_finish_components_cleans_and_validates():
+    def parse(content, repair=False):
+        return repair_json(content) if repair else json.loads(content)
+
+    item = {"sentence": "rāmaḥ kālāgnisadṛśaḥ krodhe।"}
+    content = "{'upameya': 'rāmaḥ।', 'upamāna': 'kālāgni',}"
+    record = finish_components(item, [content], parse, model="m", clean=True)
+    assert record["components"] == {"upameya": "rāmaḥ", "upamāna": "kālāgni"}
+    assert record["validation"] == {"upameya": "exact", "upamāna": "exact"}
+    assert record["model"] == "m"
+    with pytest.raises(ValueError):
+        finish_components(item, [content], parse)
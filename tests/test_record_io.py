@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from record_io import iter_json_array, iter_records, iter_tsv
+
+
+RECORDS = [
+    {"sentence": "rāmaḥ kālāgnisadṛśaḥ krodhe।", "label": "pūrṇopamā"},
+    {"sentence": "sītā api anugatā rāmaṃ, śaśinaṃ rohiṇī yathā ।", "label": "none"},
+    {"sentence": 'nested [brackets] and "quotes"', "components": {"a": [1, 2]}},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_json_array_across_chunks(tmp_path, chunk_size):
+    path = tmp_path / "records.json"
+    path.write_text(json.dumps(RECORDS, ensure_ascii=False, indent=4), "utf-8")
+    assert list(iter_json_array(str(path), chunk_size)) == RECORDS
+
+
+def test_json_array_of_numbers_is_not_cut_at_chunk_end(tmp_path):
+    path = tmp_path / "numbers.json"
+    path.write_text("[12345, 678]", "utf-8")
+    assert list(iter_json_array(str(path), chunk_size=4)) == [12345, 678]
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [('{"sentence": "x"}', "does not contain"), ('[{"a": 1}, {"b"', "ends inside")],
+)
+def test_json_array_rejects_bad_input(tmp_path, text, message):
+    path = tmp_path / "bad.json"
+    path.write_text(text, "utf-8")
+    with pytest.raises(ValueError, match=message):
+        list(iter_json_array(str(path)))
+
+
+def test_tsv_yields_the_sentence_column(tmp_path):
+    path = tmp_path / "input.tsv"
+    path.write_text("id\tsentence\n1\tvāgarthāviva saṃpṛktau\n2\tpitarau\n", "utf-8")
+    assert list(iter_tsv(str(path))) == ["vāgarthāviva saṃpṛktau", "pitarau"]
+    records = list(iter_records(str(path)))
+    assert records == [{"sentence": "vāgarthāviva saṃpṛktau"}, {"sentence": "pitarau"}]
+
+
+def test_records_filtered_by_label(tmp_path):
+    path = tmp_path / "records.jsonl"
+    lines = [json.dumps(record, ensure_ascii=False) for record in RECORDS]
+    path.write_text("\n".join(lines[:2]) + "\n\n" + lines[2] + "\n", "utf-8")
+    assert list(iter_records(str(path))) == RECORDS
+    assert list(iter_records(str(path), label="pūrṇopamā")) == RECORDS[:1]
@@ -0,0 +1,37 @@
+from self_consistency import sampling_options, vote, vote_components
+
+
+def test_vote_takes_the_majority_and_its_share():
+    assert vote(["none", "pūrṇopamā", "none", "luptopamā"]) == ("none", 0.5)
+
+
+def test_vote_tie_goes_to_the_earliest_value():
+    assert vote(["luptopamā", "none", "none", "luptopamā"]) == ("luptopamā", 0.5)
+
+
+def test_vote_by_key_returns_the_first_spelling_seen():
+    winner, share = vote(["Rāma", "rama", "sītā"], key=str.lower)
+    assert (winner, share) == ("Rāma", 1 / 3)
+    winner, share = vote(["rāma", "Rama", "rama"], key=str.lower)
+    assert (winner, share) == ("Rama", 2 / 3)
+
+
+def test_components_vote_on_folded_values():
+    samples = [
+        {"upameya": "rāmaḥ", "upamāna": "kālāgni", "upamādyotaka": "sadṛśaḥ"},
+        {"upameya": "rāma", "upamāna": "agni"},
+        {"upameya": "sītā", "upamāna": "kālāgni"},
+    ]
+    components, agreement = vote_components(samples)
+    # rāmaḥ and rāma fold together; most samples leave out the comparator.
+    assert components == {"upameya": "rāmaḥ", "upamāna": "kālāgni"}
+    assert agreement == {
+        "upameya": 2 / 3,
+        "upamāna": 2 / 3,
+        "upamādyotaka": 2 / 3,
+    }
+
+
+def test_one_sample_sends_no_n():
+    assert sampling_options(1) == {}
+    assert sampling_options(5) == {"n": 5}
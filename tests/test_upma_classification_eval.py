@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from upma_classification_eval import (
+    compute_metrics,
+    confusion_matrices,
+    scores_from_confusion,
+)
+
+
+GOLD = ["p", "p", "l", "n", "n", "n", "l"]
+PREDICTED = ["p", "l", "l", "n", "p", "n", "n"]
+
+
+def records(gold=GOLD, predicted=PREDICTED):
+    return [
+        {"human_label": g, "label": p, "is_reasoning_correct": int(g == p)}
+        for g, p in zip(gold, predicted)
+    ]
+
+
+def test_weighted_scores_match_hand_computed_values():
+    # l: P=R=1/2, n: P=R=2/3, p: P=R=1/2; supports 2, 3 and 2.
+    results = compute_metrics(records(), verbose=False)
+    assert results["labels"] == ["l", "n", "p"]
+    assert results["confusion_matrix"] == [[1, 1, 0], [0, 2, 1], [1, 0, 1]]
+    for metric in ("accuracy", "precision", "recall", "f1"):
+        assert results[metric] == pytest.approx(4 / 7)
+    assert results["per_corr_reasoning"] == pytest.approx(4 / 7)
+
+
+def test_label_never_predicted_scores_zero_not_nan():
+    confusion = np.array([[2, 0], [1, 0]])
+    scores = scores_from_confusion(confusion)
+    assert scores["precision"] == pytest.approx(2 / 3 * 2 / 3)
+    assert not any(np.isnan(value) for value in scores.values())
+
+
+def test_bootstrap_confusions_match_one_by_one():
+    actual = np.array([0, 0, 1, 2, 2])
+    predicted = np.array([0, 1, 1, 2, 0])
+    samples = np.random.default_rng(0).integers(0, 5, size=(4, 5))
+    stacked = confusion_matrices(actual, predicted, 3, samples)
+    for sample, confusion in zip(samples, stacked):
+        expected = confusion_matrices(actual[sample], predicted[sample], 3)
+        assert (confusion == expected).all()
+
+
+def test_intervals_bracket_the_point_estimate():
+    results = compute_metrics(records() * 5, resamples=200, seed=1, verbose=False)
+    low, high = results["intervals"]["accuracy"]
+    assert low <= results["accuracy"] <= high
+    again = compute_metrics(records() * 5, resamples=200, seed=1, verbose=False)
+    assert again["intervals"] == results["intervals"]
+
+
+def test_records_without_labels_are_skipped():
+    data = records() + [{"label": "p"}]
+    assert compute_metrics(data, verbose=False) == compute_metrics(
+        records(), verbose=False
+    )
+    with pytest.raises(ValueError):
+        compute_metrics([{"label": "p"}], verbose=False)
+
+
+def test_unresolved_predictions_are_abstentions():
+    data = records() + records(["p", "n"], ["unresolved", "unresolved"])
+    results = compute_metrics(data, resamples=50, seed=0, verbose=False)
+    expected = compute_metrics(records(), resamples=50, seed=0, verbose=False)
+    assert results["abstentions"] == 2
+    assert "unresolved" not in results["labels"]
+    assert results.pop("abstentions") - expected.pop("abstentions") == 2
+    assert results == expected